@@ -1,237 +1,183 @@
 import streamlit as st
 import os
-import concurrent.futures
-import re
 import pandas as pd
 import math
-import warnings
-from PIL import Image
+import time
+from functools import partial
 
-import pytesseract
-import pdfplumber
-import docx
-import openpyxl
-from odf.opendocument import load
-from odf.text import P
-import pptx
-import csv
-import string
+from cache_textos import ESTADO_OK, INICIO_RESALTE, FIN_RESALTE
+from motor_busqueda import buscar
+from coincidencias import BuscadorPalabras, marcar
+from miniaturas import obtener_miniatura, leer_archivo
+from telemetria import Telemetria
 
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+# Límites de refresco de la vista previa durante la búsqueda
+REFRESCO_SEGUNDOS = 0.5
+REFRESCO_ARCHIVOS = 200
+FILAS_PREVIEW = 200
 
 st.title("Buscador avanzado y visual contextual")
 
-def extrar_texto_pdf(path):
-    try:
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            with pdfplumber.open(path) as pdf:
-                return '\n'.join([page.extract_text() or '' for page in pdf.pages])
-    except:
-        return ''
-
-def extraer_texto_imagen(path):
-    try:
-        img = Image.open(path)
-        return pytesseract.image_to_string(img)
-    except:
-        return ''
-
-def extraer_texto_docx(path):
-    try:
-        doc = docx.Document(path)
-        return '\n'.join([para.text for para in doc.paragraphs])
-    except:
-        return ''
-
-def extraer_texto_odt(path):
-    try:
-        text = []
-        odt = load(path)
-        for elem in odt.getElementsByType(P):
-            text.append(str(elem))
-        return '\n'.join(text)
-    except:
-        return ''
-
-def extraer_texto_xlsx(path):
-    try:
-        wb = openpyxl.load_workbook(path, data_only=True)
-        texts = []
-        for sheet in wb.worksheets:
-            for row in sheet.iter_rows(values_only=True):
-                texts.append(' '.join(str(c) if c is not None else '' for c in row))
-        return '\n'.join(texts)
-    except:
-        return ''
-
-def extraer_texto_txt(path):
-    try:
-        with open(path, 'r', encoding='utf8', errors='ignore') as f:
-            return f.read()
-    except:
-        return ''
-
-def extraer_texto_pptx(path):
-    try:
-        prs = pptx.Presentation(path)
-        texts = []
-        for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    texts.append(shape.text)
-        return '\n'.join(texts)
-    except:
-        return ''
-
-def extraer_texto_csv(path):
-    try:
-        with open(path, 'r', encoding='utf8', errors='ignore') as f:
-            reader = csv.reader(f)
-            lines = [' '.join(row) for row in reader]
-            return '\n'.join(lines)
-    except:
-        return ''
-
-def extraer_texto_archivo(path):
-    ext = path.lower().split('.')[-1]
-    if ext == 'pdf':
-        return extrar_texto_pdf(path)
-    elif ext in ('png', 'jpg', 'jpeg'):
-        return extraer_texto_imagen(path)
-    elif ext == 'docx':
-        return extraer_texto_docx(path)
-    elif ext == 'odt':
-        return extraer_texto_odt(path)
-    elif ext in ('xlsx', 'xls'):
-        return extraer_texto_xlsx(path)
-    elif ext == 'txt':
-        return extraer_texto_txt(path)
-    elif ext == 'pptx':
-        return extraer_texto_pptx(path)
-    elif ext == 'csv':
-        return extraer_texto_csv(path)
-    else:
-        return ''
-
-def buscar_archivos_en_carpeta(carpeta):
-    archivos = []
-    for root, _, files in os.walk(carpeta):
-        for file in files:
-            archivos.append(os.path.join(root, file))
-    return archivos
-
-def encontrar_fragmento(texto, palabra):
-    texto_lower = texto.lower()
-    p = palabra.lower()
-    idx = texto_lower.find(p)
-    if idx == -1:
-        return ""
-    return texto[max(0, idx-30):idx+70]
-
-def is_ocr_reliable(txt):
-    letras = sum([1 for c in txt if c in string.ascii_letters])
-    return letras > 20
-
 def resaltar_texto(texto, palabras):
+    # Los fragmentos de contenido ya traen las apariciones marcadas sobre el texto
+    # original; el resto (nombres de archivo) se marca aquí, sin acentos ni mayúsculas
     import html
-    texto = html.escape(texto)
-    for palabra in palabras:
-        palabra_esc = html.escape(palabra)
-        patron = re.compile(re.escape(palabra_esc), re.IGNORECASE)
-        texto = patron.sub(f'<b>{palabra_esc}</b>', texto)
-    return texto
+    if INICIO_RESALTE not in texto:
+        apariciones = [(inicio, fin) for inicio, fin, _ in BuscadorPalabras(palabras).buscar(texto)]
+        texto = marcar(texto, 0, len(texto), apariciones)
+    return html.escape(texto).replace(INICIO_RESALTE, '<b>').replace(FIN_RESALTE, '</b>')
 
 carpeta = st.text_input("Ruta carpeta (se busca en subcarpetas también)").strip().strip('"').strip("'")
-entrada_palabras = st.text_input("Palabras a buscar, separadas por coma")
+entrada_palabras = st.text_input(
+    "Palabras a buscar, separadas por coma",
+    help="Se encuentran las palabras que empiezan por lo buscado, sin distinguir mayúsculas ni acentos: "
+         "«factura» encuentra «facturas» pero no «prefactura»."
+)
+modo_todas = st.checkbox("Exigir todas las palabras (AND)")
+consulta_avanzada = st.checkbox('Consulta avanzada (AND, OR, NOT, "frases exactas", prefijo*)')
+solo_indice = st.checkbox("Consultar solo el índice, sin recorrer la carpeta "
+                          "(lo mantiene al día: python motor_busqueda.py watch CARPETA)")
+distancia = st.number_input("Erratas toleradas por palabra (0 = búsqueda exacta)", min_value=0, max_value=3, value=0)
+max_fragmentos = st.number_input("Fragmentos de contexto por palabra y archivo", min_value=1, max_value=20, value=3)
+max_coincidencias = st.number_input(
+    "Máximo de apariciones a contar por archivo (0 = todas)", min_value=0, value=0,
+    help="Al alcanzarlo deja de recorrer las páginas de ese archivo; la extracción de texto, que se "
+         "guarda en caché, se hace siempre completa."
+)
+num_procesos = st.number_input("Procesos de extracción en paralelo", min_value=1,
+                               max_value=max(1, os.cpu_count() or 1), value=max(1, os.cpu_count() or 1))
+limite_segundos = st.number_input("Tiempo máximo por archivo en segundos (0 = sin límite)", min_value=0, value=120)
+limite_memoria_mb = st.number_input("Memoria máxima por archivo en MB (0 = sin límite)", min_value=0, value=2048)
+reintentar_omitidos = st.checkbox("Reintentar archivos omitidos en búsquedas anteriores")
+tamano_max_mb = st.number_input("Ignorar archivos mayores de (MB, 0 = sin límite)", min_value=0, value=0)
+entrada_excluir = st.text_area("Excluir (patrones estilo .gitignore, uno por línea)", "")
+incluir_ocultos = st.checkbox("Incluir archivos y carpetas ocultos o de sistema")
+ruta_tesseract = st.text_input("Ruta de Tesseract (vacío = TESSERACT_CMD o PATH)", os.environ.get('TESSERACT_CMD', ''))
+if ruta_tesseract:
+    # Los procesos de extracción heredan el entorno
+    os.environ['TESSERACT_CMD'] = ruta_tesseract.strip().strip('"')
 
 if carpeta and entrada_palabras:
+    # Los resultados se guardan en la sesión: cambiar de página o de vista no
+    # repite la búsqueda, solo cambiar los parámetros o pulsar el botón
+    clave_busqueda = (carpeta, entrada_palabras, modo_todas, consulta_avanzada, solo_indice, distancia,
+                      max_fragmentos, max_coincidencias, tamano_max_mb, entrada_excluir, incluir_ocultos)
+    repetir = st.button("Repetir búsqueda")
     if not os.path.isdir(carpeta):
         st.error("Ruta no válida o no es carpeta")
-    else:
+    elif repetir or st.session_state.get('clave_busqueda') != clave_busqueda:
         palabras = [p.strip() for p in entrada_palabras.split(",") if p.strip()]
-        archivos = buscar_archivos_en_carpeta(carpeta)
-        resultados = []
+        excluir = [p.strip() for p in entrada_excluir.splitlines() if p.strip() and not p.startswith('#')]
+        busqueda = {'resultados': [], 'omitidos': [], 'error': None, 'por_contenido': 0, 'coincidencias_tot': 0,
+                    'telemetria': Telemetria()}
         progreso = st.progress(0)
         archivo_actual = st.empty()
         resultados_preview = st.empty()
+        filas_preview = []
+        ultimo_refresco = 0
 
         with st.spinner("Buscando contenido y nombres..."):
-            coincidencias_tot = 0
-            for i, arch in enumerate(archivos):
-                ext = arch.lower().split('.')[-1]
-                archivo_actual.text(f"Analizando {i+1} de {len(archivos)}: {os.path.basename(arch)}")
-                datos_doc = {'archivo': arch, 'matches': []}
-
-                encontrado_nombre_ruta = False
-                for p in palabras:
-                    if p.lower() in os.path.basename(arch).lower() or p.lower() in arch.lower():
-                        if not encontrado_nombre_ruta:
-                            coincidencias_tot += 1
-                            encontrado_nombre_ruta = True
-                        datos_doc['matches'].append({
-                            'tipo': 'nombre/ruta',
-                            'palabra': p,
-                            'fragmento': os.path.basename(arch)
-                        })
-
-                try:
-                    contenido = extraer_texto_archivo(arch)
-                    if contenido:
-                        for p in palabras:
-                            ocurrencias = contenido.lower().count(p.lower())
-                            if ocurrencias > 0:
-                                coincidencias_tot += ocurrencias
-                                fragmento = encontrar_fragmento(contenido, p)
-                                if ext in ('png', 'jpg', 'jpeg'):
-                                    confiable = is_ocr_reliable(contenido)
-                                    datos_doc['matches'].append({
-                                        'tipo': 'OCR Imagen' + ('' if confiable else ' (NO CONCLUYENTE)'),
-                                        'palabra': p,
-                                        'fragmento': fragmento if confiable else 'OCR demasiado corto o ruidoso',
-                                        'ocr': contenido if confiable else ''
-                                    })
-                                else:
-                                    datos_doc['matches'].append({
-                                        'tipo': 'contenido',
-                                        'palabra': p,
-                                        'fragmento': fragmento
-                                    })
-                except:
-                    pass
-
-                if datos_doc['matches']:
-                    resultados.append(datos_doc)
-
-                progreso.progress((i+1)/len(archivos))
-                if resultados:
-                    tabla = pd.DataFrame([
-                        {'Archivo': os.path.basename(r['archivo']),
-                         'Tipo': m['tipo'],
-                         'Palabra': m['palabra'],
-                         'Fragmento': m['fragmento']}
-                        for r in resultados for m in r['matches']
-                    ])
-                    resultados_preview.dataframe(tabla)
+            eventos = buscar(carpeta, palabras, consulta=entrada_palabras if consulta_avanzada else None,
+                             todas=modo_todas, workers=int(num_procesos), limite_segundos=limite_segundos,
+                             limite_memoria_mb=limite_memoria_mb, reintentar_omitidos=reintentar_omitidos,
+                             tamano_max=tamano_max_mb * 1024 * 1024, excluir=excluir, ocultos=incluir_ocultos,
+                             max_fragmentos=max_fragmentos, max_coincidencias=max_coincidencias,
+                             distancia=distancia, solo_indice=solo_indice, telemetria=busqueda['telemetria'])
+            for evento in eventos:
+                if evento['evento'] == 'archivo':
+                    if evento['estado'] != ESTADO_OK:
+                        busqueda['omitidos'].append({'Archivo': evento['archivo'], 'Estado': evento['estado']})
+                    # Solo se añaden las filas nuevas, sin reconstruir lo anterior
+                    filas_preview.extend(
+                        {'Archivo': os.path.basename(evento['archivo']), 'Tipo': m['tipo'],
+                         'Palabra': m['palabra'], 'Fragmento': m['fragmento']}
+                        for m in evento['matches']
+                    )
+                    # La interfaz se refresca como mucho cada REFRESCO_SEGUNDOS o REFRESCO_ARCHIVOS
+                    ahora = time.monotonic()
+                    if ahora - ultimo_refresco >= REFRESCO_SEGUNDOS or evento['procesados'] % REFRESCO_ARCHIVOS == 0:
+                        ultimo_refresco = ahora
+                        archivo_actual.text(f"Analizando {evento['procesados']} de {evento['encontrados']} "
+                                            f"encontrados: {os.path.basename(evento['archivo'])}")
+                        progreso.progress(evento['procesados'] / evento['encontrados'])
+                        if filas_preview:
+                            resultados_preview.dataframe(pd.DataFrame(filas_preview[-FILAS_PREVIEW:]))
+                elif evento['evento'] == 'error':
+                    busqueda['error'] = evento['mensaje']
+                elif evento['evento'] == 'resultado':
+                    busqueda['resultados'].append(evento)
+                elif evento['evento'] == 'fin':
+                    busqueda.update(evento)
+                    progreso.progress(1.0)
+                    archivo_actual.text(f"Analizados {evento['procesados']} archivos")
+
+        resultados_preview.empty()
+        st.session_state['clave_busqueda'] = clave_busqueda
+        st.session_state['busqueda'] = busqueda
+
+    busqueda = st.session_state.get('busqueda')
+    if busqueda is not None and st.session_state.get('clave_busqueda') == clave_busqueda:
+        resultados = busqueda['resultados']
+        if busqueda['error']:
+            st.error(busqueda['error'])
+
+        if busqueda['omitidos']:
+            with st.expander(f"Archivos omitidos: {len(busqueda['omitidos'])}"):
+                st.dataframe(pd.DataFrame(busqueda['omitidos']))
+
+        telemetria = busqueda['telemetria']
+        if telemetria.medidas:
+            with st.expander("Rendimiento de la extracción"):
+                st.write("Por formato (velocidad calculada solo sobre lo extraído, sin la caché):")
+                st.dataframe(pd.DataFrame(telemetria.por_formato()))
+                top_n = st.number_input("Archivos más lentos a mostrar", min_value=1, max_value=100, value=10)
+                lentos = telemetria.mas_lentos(int(top_n))
+                if lentos:
+                    st.dataframe(pd.DataFrame(lentos)[['archivo', 'segundos', 'bytes', 'caracteres', 'estado', 'error']])
+                fallos = telemetria.fallos()
+                if fallos:
+                    st.write("Fallos por formato y tipo de error:")
+                    st.dataframe(pd.DataFrame(fallos))
+                col_csv, col_json = st.columns(2)
+                col_csv.download_button("Exportar CSV", data=telemetria.a_csv, file_name="telemetria_extraccion.csv",
+                                        mime="text/csv")
+                col_json.download_button("Exportar JSON", data=telemetria.a_json,
+                                         file_name="telemetria_extraccion.json", mime="application/json")
 
         if resultados:
-            st.success(f"Búsqueda completada. Total coincidencias (sumando todas): {coincidencias_tot}")
-            for res in resultados:
+            st.success(f"Búsqueda completada. Documentos con coincidencias: {len(resultados)} "
+                       f"({busqueda['por_contenido']} por contenido). "
+                       f"Total apariciones en contenido: {busqueda['coincidencias_tot']}")
+            # Vista paginada: solo se dibujan los resultados de la página actual
+            col_tamano, col_pagina = st.columns(2)
+            por_pagina = col_tamano.selectbox("Resultados por página", [10, 25, 50, 100], index=1)
+            num_paginas = math.ceil(len(resultados) / por_pagina)
+            pagina = col_pagina.number_input(f"Página (de {num_paginas})", min_value=1, max_value=num_paginas, value=1)
+            for res in resultados[(pagina - 1) * por_pagina:pagina * por_pagina]:
                 st.markdown(f"---")
                 st.markdown(f"**Archivo:** {res['archivo']}")
+                if res.get('copias'):
+                    st.write(f"Copias idénticas ({len(res['copias'])}):")
+                    st.markdown('\n'.join(f"- {copia}" for copia in res['copias']))
                 for m in res['matches']:
                     st.write(f"Tipo de coincidencia: {m['tipo']}")
                     st.write(f"Palabra encontrada: {m['palabra']}")
-                    st.write(f"Fragmento/contexto:")
-                    st.markdown(resaltar_texto(m['fragmento'], [m['palabra']]), unsafe_allow_html=True)
+                    if m.get('ocurrencias'):
+                        st.write(f"Apariciones: {m['ocurrencias']}")
+                    for ubicacion, fragmento in m.get('fragmentos') or [('', m['fragmento'])]:
+                        st.write(f"Fragmento/contexto ({ubicacion}):" if ubicacion else "Fragmento/contexto:")
+                        st.markdown(resaltar_texto(fragmento, [w for w in m['palabra'].split(', ') if w]), unsafe_allow_html=True)
                     ext = res['archivo'].lower().split('.')[-1]
                     if m.get('ocr') and ext in ('png', 'jpg', 'jpeg'):
                         st.info("Texto OCR extraído completo:")
                         st.code(m['ocr'][:800])
-                    if ext in ('png','jpg','jpeg'):
-                        st.image(Image.open(res['archivo']), caption=res['archivo'])
-                with open(res['archivo'], 'rb') as f:
-                    st.download_button(label="Descargar", data=f, file_name=os.path.basename(res['archivo']))
+                if res['archivo'].lower().split('.')[-1] in ('png', 'jpg', 'jpeg'):
+                    miniatura = obtener_miniatura(res['archivo'])
+                    if miniatura:
+                        st.image(miniatura, caption=res['archivo'])
+                # El archivo solo se lee cuando se pulsa el botón
+                st.download_button(label="Descargar", data=partial(leer_archivo, res['archivo']),
+                                   file_name=os.path.basename(res['archivo']), key=f"descargar_{res['archivo']}")
         else:
             st.info("No se encontraron coincidencias para esa búsqueda.")
 else:
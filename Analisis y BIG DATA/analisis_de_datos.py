@@ -1,59 +1,95 @@
+import os
 import streamlit as st
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import io
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
+from functools import partial
+
+from ingesta_datos import (
+    cargar_datos, cargar_varios, huella_datos, archivos_carpeta, leer_datos, CacheTablas, MEMORIA_MAX
+)
+from filtros_datos import MotorFiltros
+from clustering_datos import (
+    MUESTRA_AJUSTE, CacheModelos, clave_filtros, preparar_clustering, proyeccion_completa, ajustar_kmeans,
+    barrido_k
+)
+from exportar_datos import FORMATOS, FILAS_MAX_EXCEL, formatos_disponibles, exportar
+from graficos_datos import UMBRAL_PUNTOS, TOP_N_BARRAS, barras_top, densidad_por_grupo, dibujar_densidad
 
 st.set_page_config(page_title="Analizador Interactivo Mejorado", layout="wide")
 
 st.title("Analizador Interactivo y Mejorado con Limpieza Automática")
 
-def limpiar_y_maquetar(df: pd.DataFrame) -> pd.DataFrame:
-    # Eliminar filas completamente vacías
-    df = df.dropna(how='all')
-
-    # Detectar encabezado correcto si las columnas tienen muchos 'Unnamed'
-    if df.columns.str.contains('Unnamed').sum() > len(df.columns) // 2:
-        for i in range(min(3, len(df))):  # revisar primeras 3 filas
-            if df.iloc[i].notna().sum() > len(df.columns) / 2:
-                df.columns = df.iloc[i]
-                df = df.drop(index=range(i+1))
-                break
-
-    # Quitar columnas con nombre Unnamed o vacío
-    df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
-
-    # Resetear índice
-    df = df.reset_index(drop=True)
+@st.cache_resource
+def cache_tablas():
+    # Una sola caché en memoria para todas las sesiones y recargas
+    return CacheTablas(MEMORIA_MAX)
 
-    # Opcional: rellenar NaNs en columnas clave si quieres
-    # df['Proyecto'] = df['Proyecto'].fillna('No especificado')
+# Columnas de texto con más valores distintos que esto se filtran por búsqueda
+MAX_VALORES_LISTA = 200
+TOP_K_FILTRO = 50
 
-    return df
+def a_float64(serie):
+    # Las columnas compactadas a float32 se acumulan en float64 para no perder precisión en sumas
+    return serie.astype('float64') if serie.dtype == np.float32 else serie
 
-uploaded_file = st.file_uploader(
-    "Sube tu archivo (Excel, CSV, TSV)", type=["xlsx", "xls", "csv", "tsv"]
+uploaded_files = st.file_uploader(
+    "Sube tus archivos (Excel, CSV, TSV)", type=["xlsx", "xls", "csv", "tsv"], accept_multiple_files=True
 )
+carpeta = st.text_input("O indica una carpeta local con archivos Excel, CSV o TSV").strip()
 
-if uploaded_file is not None:
-    file_type = uploaded_file.name.split('.')[-1].lower()
+# (nombre, ruta o función que devuelve el contenido, clave de su huella en la
+# sesión); el contenido solo se lee si hace falta
+archivos = [(f.name, f.getvalue, ('huella', f.file_id)) for f in uploaded_files or []]
+if carpeta:
     try:
-        if file_type in ['xlsx', 'xls']:
-            df = pd.read_excel(uploaded_file)
-        elif file_type == 'csv':
-            df = pd.read_csv(uploaded_file)
-        elif file_type == 'tsv':
-            df = pd.read_csv(uploaded_file, sep='\t')
+        for ruta in archivos_carpeta(carpeta):
+            info = os.stat(ruta)
+            archivos.append((os.path.relpath(ruta, carpeta), ruta,
+                             ('huella', ruta, info.st_size, info.st_mtime_ns)))
+    except OSError as e:
+        st.error(f"No se puede leer la carpeta: {e}")
+        st.stop()
+
+if archivos:
+    persistir = st.sidebar.checkbox("Guardar tablas leídas en caché de disco (Parquet)", value=True)
+    # La huella del contenido se calcula una vez por archivo, no en cada recarga
+    for _, contenido, clave_subida in archivos:
+        if clave_subida not in st.session_state:
+            st.session_state[clave_subida] = huella_datos(leer_datos(contenido))
+    try:
+        if len(archivos) == 1:
+            nombre, contenido, clave_subida = archivos[0]
+            df, origen = cargar_datos(contenido, nombre, cache_tablas(), persistir, st.session_state[clave_subida])
+            huella = st.session_state[clave_subida]
         else:
-            st.error("Formato no soportado.")
-            st.stop()
+            workers = st.sidebar.number_input("Procesos para leer archivos", min_value=1,
+                                              max_value=max(1, os.cpu_count() or 1),
+                                              value=max(1, os.cpu_count() or 1))
+            # Los nombres repetidos se distinguen para la columna de archivo de origen
+            vistos = {}
+            for n, (nombre, contenido, clave_subida) in enumerate(archivos):
+                vistos[nombre] = vistos.get(nombre, 0) + 1
+                if vistos[nombre] > 1:
+                    archivos[n] = (f"{nombre} ({vistos[nombre]})", contenido, clave_subida)
+            lista = [(nombre, contenido, st.session_state[clave_subida])
+                     for nombre, contenido, clave_subida in archivos]
+            huella = huella_datos(repr([(nombre, h) for nombre, _, h in lista]).encode())
+            with st.spinner(f"Leyendo {len(lista)} archivos..."):
+                df, origenes, errores = cargar_varios(lista, cache_tablas(), persistir, workers)
+            for nombre, error in errores.items():
+                st.warning(f"No se pudo leer {nombre}: {error}")
+            origen = next(o for o in ('archivo', 'disco', 'memoria') if o in origenes.values())
+            st.caption(f"{len(origenes)} archivos unidos en una sola tabla ({len(df)} filas).")
     except Exception as e:
         st.error(f"Error leyendo archivo: {e}")
         st.stop()
-
-    df = limpiar_y_maquetar(df)
+    if origen != 'archivo':
+        st.caption(f"Datos recuperados de la caché ({origen}).")
+    medida = df.attrs.get('memoria')
+    if medida and medida['antes']:
+        st.caption(f"Memoria: {medida['antes'] / 1e6:.1f} MB leída tal cual, {medida['despues'] / 1e6:.1f} MB "
+                   f"con tipos compactos ({1 - medida['despues'] / medida['antes']:.0%} menos).")
 
     if df.empty:
         st.warning("Archivo vacío o sin datos útiles después de limpiar.")
@@ -62,41 +98,74 @@ if uploaded_file is not None:
     st.subheader("Vista previa de datos")
     st.dataframe(df.head())
 
-    columnas_objeto = df.select_dtypes(include=['object']).columns.tolist()
+    # Las columnas de texto repetitivo llegan como categoría
+    columnas_objeto = df.select_dtypes(include=['object', 'string', 'category']).columns.tolist()
     columnas_numericas = df.select_dtypes(include=['number', 'timedelta']).columns.tolist()
     columnas_fecha = df.select_dtypes(include=['datetime', 'datetimetz']).columns.tolist()
 
+    to_datetime_cols = []
     if not columnas_fecha and columnas_objeto:
         to_datetime_cols = st.multiselect("Convertir columnas a fecha (opcional)", columnas_objeto)
+        columnas_objeto = [col for col in columnas_objeto if col not in to_datetime_cols]
+
+    columnas_numericas_real = [
+        col + '_seg' if np.issubdtype(df[col].dtype, np.timedelta64) else col for col in columnas_numericas
+    ]
+
+    # Las conversiones y el motor de filtros se preparan una vez por archivo y
+    # columnas de fecha elegidas; las recargas reutilizan la tabla preparada
+    clave_motor = (huella, tuple(to_datetime_cols))
+    if st.session_state.get('clave_motor') != clave_motor:
         for col in to_datetime_cols:
             df[col] = pd.to_datetime(df[col], errors='coerce')
-        columnas_fecha = df.select_dtypes(include=['datetime', 'datetimetz']).columns.tolist()
+        for col in columnas_numericas:
+            if np.issubdtype(df[col].dtype, np.timedelta64):
+                df[col + '_seg'] = df[col].dt.total_seconds()
+        st.session_state['motor_filtros'] = MotorFiltros(df)
+        st.session_state['clave_motor'] = clave_motor
+    motor = st.session_state['motor_filtros']
+    df = motor.df
+    columnas_fecha = df.select_dtypes(include=['datetime', 'datetimetz']).columns.tolist()
 
     st.sidebar.header("Filtros mejorados")
     filtros = dict()
 
-    # Multi-selección texto y fechas
-    for col in columnas_objeto + columnas_fecha:
-        opciones_raw = df[col].dropna().astype(str).unique().tolist()
-        opciones = sorted(opciones_raw)
-        seleccion = st.sidebar.multiselect(f"Filtrar por {col}", opciones, default=opciones)
-        if seleccion and len(seleccion) < len(opciones):
+    # Texto: lista completa si hay pocos valores distintos; si hay muchos
+    # (identificadores), búsqueda por texto o selección entre los más frecuentes
+    for col in columnas_objeto:
+        resumen_col = motor.resumen(col)
+        if resumen_col['distintos'] <= MAX_VALORES_LISTA:
+            opciones = motor.opciones(col)
+            seleccion = st.sidebar.multiselect(f"Filtrar por {col}", opciones, default=opciones)
+            if seleccion and len(seleccion) < len(opciones):
+                filtros[col] = seleccion
+            continue
+        buscado = st.sidebar.text_input(f"Buscar en {col} ({resumen_col['distintos']} valores distintos)")
+        frecuentes = [valor for valor, _ in resumen_col['frecuentes'][:TOP_K_FILTRO]]
+        seleccion = st.sidebar.multiselect(f"{col}: valores más frecuentes", frecuentes)
+        if seleccion:
             filtros[col] = seleccion
+        elif buscado.strip():
+            filtros[col] = buscado.strip()
 
-    columnas_numericas_real = []
-    for col in columnas_numericas:
-        if np.issubdtype(df[col].dtype, np.timedelta64):
-            df[col + '_seg'] = df[col].dt.total_seconds()
-            columnas_numericas_real.append(col + '_seg')
-        else:
-            columnas_numericas_real.append(col)
+    # Fechas: rango en vez de lista de valores. Como con las listas, solo se
+    # filtra si se estrecha el rango: así no se pierden las filas sin fecha
+    for col in columnas_fecha:
+        rango_col = motor.rango(col)
+        if rango_col is None or rango_col[0] == rango_col[1]:
+            continue
+        seleccion = st.sidebar.slider(f"Rango para {col}", rango_col[0], rango_col[1], rango_col,
+                                      format="YYYY-MM-DD")
+        if tuple(seleccion) != tuple(rango_col):
+            filtros[col] = seleccion
 
     for col in columnas_numericas_real:
-        col_data = df[col].dropna()
-        if col_data.empty:
+        rango_col = motor.rango(col)
+        if rango_col is None:
+            continue
+        min_val, max_val = rango_col
+        if min_val == max_val:
             continue
-        min_val = col_data.min()
-        max_val = col_data.max()
         rango = st.sidebar.slider(
             f"Rango para {col.replace('_seg', ' (segundos)')}",
             float(min_val), float(max_val),
@@ -104,12 +173,8 @@ if uploaded_file is not None:
         )
         filtros[col] = rango
 
-    df_filtrado = df.copy()
-    for col, vals in filtros.items():
-        if col in columnas_objeto + columnas_fecha:
-            df_filtrado = df_filtrado[df_filtrado[col].astype(str).isin(vals)]
-        else:
-            df_filtrado = df_filtrado[(df_filtrado[col] >= vals[0]) & (df_filtrado[col] <= vals[1])]
+    # Una máscara por filtro, recalculada solo si cambia; sin copiar la tabla
+    df_filtrado = motor.filtrar(filtros)
 
     st.subheader(f"Datos filtrados - {len(df_filtrado)} filas")
     st.dataframe(df_filtrado)
@@ -119,72 +184,126 @@ if uploaded_file is not None:
         col1, col2 = st.columns(2)
         with col1:
             for col in columnas_numericas_real[:len(columnas_numericas_real)//2 + 1]:
-                val = df_filtrado[col].sum() if not df_filtrado.empty else 0
+                val = a_float64(df_filtrado[col]).sum() if not df_filtrado.empty else 0
                 st.metric(f"Suma {col.replace('_seg',' (segundos)')}", round(val, 2))
         with col2:
             for col in columnas_numericas_real[len(columnas_numericas_real)//2 + 1:]:
-                val = df_filtrado[col].mean() if not df_filtrado.empty else 0
+                val = a_float64(df_filtrado[col]).mean() if not df_filtrado.empty else 0
                 st.metric(f"Promedio {col.replace('_seg',' (segundos)')}", round(val, 2))
 
     st.subheader("Visualización")
     if not df_filtrado.empty and columnas_objeto and columnas_numericas_real:
         cat_col = columnas_objeto[0]
         num_col = columnas_numericas_real[0]
-        resumen = df_filtrado.groupby(cat_col)[num_col].sum().sort_values(ascending=False)
+        # Agregado con los códigos del motor de filtros, guardado por estado de filtros
+        resumen = motor.suma_por_grupo(cat_col, num_col)
         if not resumen.empty:
             fig, ax = plt.subplots(figsize=(8,4))
-            resumen.plot(kind='bar', ax=ax, color='cornflowerblue')
+            barras_top(resumen).plot(kind='bar', ax=ax, color='cornflowerblue')
             ax.set_ylabel(num_col.replace('_seg', ' (segundos)'))
             ax.set_xlabel(cat_col)
             ax.set_title(f"Suma de {num_col.replace('_seg', ' (segundos)')} por {cat_col}")
             st.pyplot(fig)
+            if len(resumen) > TOP_N_BARRAS + 1:
+                st.caption(f"{len(resumen)} valores de {cat_col}: se muestran los {TOP_N_BARRAS} mayores "
+                           f"y el resto sumado.")
         else:
             st.info("No hay datos para graficar con los filtros actuales.")
 
     st.subheader("Clustering")
     cols_cluster = st.multiselect("Columnas numéricas para clustering (mínimo 2)", columnas_numericas_real)
     if len(cols_cluster) >= 2 and not df_filtrado.empty:
-        data_cluster = df_filtrado[cols_cluster].dropna()
-        if len(data_cluster) > 0:
-            pca = PCA(n_components=2)
-            pca_res = pca.fit_transform(data_cluster)
+        escalable = st.checkbox(f"Modo escalable (MiniBatchKMeans sobre una muestra de {MUESTRA_AJUSTE} filas)",
+                                value=len(df_filtrado) > MUESTRA_AJUSTE)
+        estrato = None
+        if escalable:
+            estratos = [c for c in columnas_objeto if motor.resumen(c)['distintos'] <= MAX_VALORES_LISTA]
+            estrato = st.selectbox("Estratificar la muestra por", [None] + estratos,
+                                   format_func=lambda c: "Sin estratificar" if c is None else c)
 
-            n_clusters = st.slider("Número de clusters", 2, 6, 3)
-            kmeans = KMeans(n_clusters=n_clusters, n_init=10, random_state=42)
-            clusters = kmeans.fit_predict(data_cluster)
+        # Preparación y modelos se guardan por columnas, filtros y k: mover
+        # otros controles no vuelve a ajustar
+        modelos = st.session_state.setdefault('modelos_cluster', CacheModelos())
+        clave_cluster = (st.session_state['clave_motor'], tuple(cols_cluster), clave_filtros(filtros),
+                         escalable, estrato)
+        preparado = modelos.obtener_o_calcular(clave_cluster, lambda: preparar_clustering(
+            df_filtrado, cols_cluster, df_filtrado[estrato] if estrato else None,
+            MUESTRA_AJUSTE if escalable else None
+        ))
+        if preparado['filas'] >= 2:
+            n_clusters = min(st.slider("Número de clusters", 2, 6, 3), preparado['filas'])
+            modelo = modelos.obtener_o_calcular(clave_cluster + (n_clusters,),
+                                                lambda: ajustar_kmeans(preparado, n_clusters, escalable))
 
             fig2, ax2 = plt.subplots(figsize=(8,5))
-            scatter = ax2.scatter(pca_res[:,0], pca_res[:,1], c=clusters, cmap='viridis', alpha=0.7)
-            legend = ax2.legend(*scatter.legend_elements(), title="Clusters")
-            ax2.add_artist(legend)
-            ax2.set_xlabel("PCA 1")
-            ax2.set_ylabel("PCA 2")
-            ax2.set_title("Clustering con PCA 2D")
+            if preparado['filas'] > UMBRAL_PUNTOS:
+                # Demasiados puntos para un marcador por fila: imagen de densidad
+                # de todas las filas, coloreada por el cluster dominante
+                densidad = modelos.obtener_o_calcular(
+                    clave_cluster + (n_clusters, 'densidad'),
+                    lambda: densidad_por_grupo(*proyeccion_completa(preparado).T, modelo['etiquetas'], n_clusters)
+                )
+                dibujar_densidad(ax2, densidad, n_clusters)
+            else:
+                proyeccion = preparado['proyeccion']
+                scatter = ax2.scatter(proyeccion[:,0], proyeccion[:,1], c=modelo['etiquetas'][preparado['puntos']],
+                                      cmap='viridis', alpha=0.7)
+                legend = ax2.legend(*scatter.legend_elements(), title="Clusters")
+                ax2.add_artist(legend)
+            ax2.set_xlabel(f"PCA 1 ({preparado['varianza'][0]:.0%})")
+            ax2.set_ylabel(f"PCA 2 ({preparado['varianza'][1]:.0%})")
+            ax2.set_title("Clustering con PCA 2D (columnas estandarizadas)")
             st.pyplot(fig2)
+            dibujados = (f"densidad de {preparado['filas']} filas" if preparado['filas'] > UMBRAL_PUNTOS
+                         else f"{len(preparado['puntos'])} puntos dibujados")
+            st.caption(f"{preparado['filas']} filas asignadas, ajuste con {len(preparado['muestra'])}, {dibujados}.")
+            st.dataframe(modelo['centros'])
+
+            with st.expander("Elegir el número de clusters (codo y silueta)"):
+                ks = tuple(range(2, min(10, preparado['filas'] - 1) + 1))
+                clave_barrido = clave_cluster + ('barrido', ks)
+                barrido = modelos.obtener(clave_barrido)
+                if barrido is None and ks and st.button(f"Calcular para k = 2..{ks[-1]}"):
+                    progreso = st.progress(0.0)
+                    parcial = st.empty()
+                    resultados = []
+                    # Cada k se muestra en cuanto termina su ajuste
+                    for resultado in barrido_k(preparado, ks):
+                        resultados.append(resultado)
+                        progreso.progress(len(resultados) / len(ks))
+                        parcial.dataframe(pd.DataFrame(sorted(resultados), columns=['k', 'inercia', 'silueta'])
+                                          .set_index('k'))
+                    progreso.empty()
+                    parcial.empty()
+                    barrido = pd.DataFrame(sorted(resultados), columns=['k', 'inercia', 'silueta']).set_index('k')
+                    modelos.guardar(clave_barrido, barrido)
+                if barrido is not None:
+                    grafico1, grafico2 = st.columns(2)
+                    with grafico1:
+                        st.caption("Inercia (codo)")
+                        st.line_chart(barrido['inercia'])
+                    with grafico2:
+                        st.caption("Silueta (mayor es mejor)")
+                        st.line_chart(barrido['silueta'])
         else:
             st.info("No hay suficientes datos para clustering tras filtrar.")
     else:
         st.info("Selecciona al menos 2 columnas numéricas para clustering.")
 
     st.subheader("Exportar resultados filtrados")
-    formato = st.selectbox("Formato de exportación", ["Excel (.xlsx)", "CSV (.csv)"])
-    towrite = io.BytesIO()
-    if formato == "Excel (.xlsx)":
-        df_filtrado.to_excel(towrite, index=False)
-        mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        nombre = "datos_filtrados.xlsx"
-    else:
-        towrite_str = io.StringIO()
-        df_filtrado.to_csv(towrite_str, index=False)
-        mime = "text/csv"
-        nombre = "datos_filtrados.csv"
+    formato = st.selectbox("Formato de exportación", formatos_disponibles(len(df_filtrado)))
+    extension, mime = FORMATOS[formato]
+    if len(df_filtrado) > FILAS_MAX_EXCEL:
+        st.caption("Demasiadas filas para una hoja de Excel: exporta en CSV o Parquet.")
 
+    # El archivo solo se genera al pulsar el botón, no en cada recarga
     st.download_button(
         "Descargar archivo filtrado",
-        data=towrite if formato.startswith("Excel") else towrite_str.getvalue(),
-        file_name=nombre,
+        data=partial(exportar, df_filtrado, formato),
+        file_name=f"datos_filtrados.{extension}",
         mime=mime,
     )
 
 else:
-    st.info("Sube un archivo para comenzar a analizar tus datos. Soporta Excel, CSV y TSV.")
+    st.info("Sube uno o varios archivos, o indica una carpeta, para comenzar a analizar tus datos. "
+            "Soporta Excel, CSV y TSV.")
@@ -0,0 +1,216 @@
+import os
+import csv
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+import docx
+import openpyxl
+import pptx
+from pptx.util import Inches
+from odf.opendocument import OpenDocumentText
+from odf.text import P
+from PIL import Image, ImageDraw, ImageFont
+
+from cache_textos import ESTADO_NO_DISPONIBLE
+from extractores import extraer_con_error, extraer_en_procesos, HerramientaNoDisponible
+
+# Banco de pruebas de los extractores: genera corpus sintéticos de cada formato
+# en varios tamaños y mide archivos/s y MB/s.
+#   python benchmark_extractores.py --archivos 5 --workers 4 --json
+
+VOCABULARIO = ('presupuesto factura contrato obra cliente proveedor importe fecha entrega '
+               'albarán pedido revisión informe medición partida total iva pago plazo '
+               'documento firma anexo cláusula garantía mantenimiento instalación').split()
+TAMANOS = {'pequeño': 20, 'mediano': 200, 'grande': 2000}
+FORMATOS = ('txt', 'csv', 'docx', 'xlsx', 'pptx', 'odt', 'pdf', 'png')
+
+
+def lineas_aleatorias(azar, n, palabras=12):
+    return [' '.join(azar.choice(VOCABULARIO) for _ in range(palabras)) for _ in range(n)]
+
+
+def generar_txt(path, azar, n):
+    with open(path, 'w', encoding='utf8') as f:
+        f.write('\n'.join(lineas_aleatorias(azar, n)))
+
+
+def generar_csv(path, azar, n):
+    with open(path, 'w', encoding='utf8', newline='') as f:
+        escritor = csv.writer(f)
+        for linea in lineas_aleatorias(azar, n, 6):
+            escritor.writerow(linea.split() + [azar.randint(1, 10000)])
+
+
+def generar_docx(path, azar, n):
+    doc = docx.Document()
+    for linea in lineas_aleatorias(azar, n):
+        doc.add_paragraph(linea)
+    doc.save(path)
+
+
+def generar_xlsx(path, azar, n):
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('Datos')
+    for linea in lineas_aleatorias(azar, n, 6):
+        ws.append(linea.split() + [azar.randint(1, 10000)])
+    wb.save(path)
+
+
+def generar_pptx(path, azar, n):
+    prs = pptx.Presentation()
+    for _ in range(max(1, n // 10)):
+        slide = prs.slides.add_slide(prs.slide_layouts[6])
+        caja = slide.shapes.add_textbox(Inches(0.5), Inches(0.5), Inches(9), Inches(6))
+        caja.text_frame.text = '\n'.join(lineas_aleatorias(azar, 10))
+    prs.save(path)
+
+
+def generar_odt(path, azar, n):
+    doc = OpenDocumentText()
+    for linea in lineas_aleatorias(azar, n):
+        doc.text.addElement(P(text=linea))
+    doc.save(path)
+
+
+def generar_pdf(path, azar, n):
+    # PDF mínimo con capa de texto (Helvetica), 40 líneas por página
+    def escapar(texto):
+        return texto.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    lineas = [l.encode('latin-1', 'replace').decode('latin-1') for l in lineas_aleatorias(azar, n * 2)]
+    paginas = [lineas[i:i + 40] for i in range(0, len(lineas), 40)]
+    objetos = [b'<< /Type /Catalog /Pages 2 0 R >>', None,
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>']
+    hijos = []
+    for pagina in paginas:
+        contenido = 'BT /F1 10 Tf 14 TL 40 800 Td ' + ' '.join(f'({escapar(l)}) Tj T*' for l in pagina) + ' ET'
+        contenido = contenido.encode('latin-1')
+        num_pagina = len(objetos) + 1
+        hijos.append(f'{num_pagina} 0 R')
+        objetos.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+                       f'/Resources << /Font << /F1 3 0 R >> >> /Contents {num_pagina + 1} 0 R >>'.encode())
+        objetos.append(b'<< /Length %d >>\nstream\n' % len(contenido) + contenido + b'\nendstream')
+    objetos[1] = f'<< /Type /Pages /Kids [{" ".join(hijos)}] /Count {len(hijos)} >>'.encode()
+
+    salida = bytearray(b'%PDF-1.4\n')
+    posiciones = []
+    for num, objeto in enumerate(objetos, 1):
+        posiciones.append(len(salida))
+        salida += b'%d 0 obj\n' % num + objeto + b'\nendobj\n'
+    inicio_xref = len(salida)
+    salida += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objetos) + 1)
+    salida += b''.join(b'%010d 00000 n \n' % p for p in posiciones)
+    salida += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objetos) + 1, inicio_xref)
+    with open(path, 'wb') as f:
+        f.write(salida)
+
+
+def generar_png(path, azar, n):
+    lineas = lineas_aleatorias(azar, max(2, n // 10), 8)
+    try:
+        fuente = ImageFont.load_default(size=20)
+    except TypeError:
+        fuente = ImageFont.load_default()
+    img = Image.new('L', (1200, 40 + 30 * len(lineas)), 255)
+    dibujo = ImageDraw.Draw(img)
+    for i, linea in enumerate(lineas):
+        dibujo.text((20, 20 + 30 * i), linea, fill=0, font=fuente)
+    img.save(path)
+
+
+GENERADORES = {
+    'txt': generar_txt, 'csv': generar_csv, 'docx': generar_docx, 'xlsx': generar_xlsx,
+    'pptx': generar_pptx, 'odt': generar_odt, 'pdf': generar_pdf, 'png': generar_png,
+}
+
+
+def generar_corpus(carpeta, formatos=FORMATOS, tamanos=TAMANOS, archivos=5, semilla=1):
+    # Devuelve {(formato, tamaño): [rutas]}
+    azar = random.Random(semilla)
+    corpus = {}
+    for formato in formatos:
+        for tamano, unidades in tamanos.items():
+            destino = os.path.join(carpeta, formato, tamano)
+            os.makedirs(destino, exist_ok=True)
+            rutas = []
+            for i in range(archivos):
+                ruta = os.path.join(destino, f'doc_{i}.{formato}')
+                GENERADORES[formato](ruta, azar, unidades)
+                rutas.append(ruta)
+            corpus[(formato, tamano)] = rutas
+    return corpus
+
+
+def medir(rutas, workers=0):
+    # Extrae las rutas en este proceso (workers=0) o con el grupo de procesos.
+    # 'omitido' indica la dependencia que falta si algún archivo no se pudo extraer.
+    inicio = time.perf_counter()
+    caracteres = 0
+    faltan = set()
+    if workers:
+        for _, texto, _, estado, medida in extraer_en_procesos(((r, None) for r in rutas), workers, 0, 0):
+            caracteres += len(texto)
+            if estado == ESTADO_NO_DISPONIBLE:
+                faltan.add(medida['error'])
+    else:
+        for ruta in rutas:
+            try:
+                caracteres += len(extraer_con_error(ruta)[0])
+            except (ImportError, HerramientaNoDisponible) as e:
+                faltan.add(str(e) or type(e).__name__)
+    segundos = time.perf_counter() - inicio
+    megas = sum(os.path.getsize(r) for r in rutas) / (1024 * 1024)
+    return {
+        'archivos': len(rutas),
+        'mb': round(megas, 3),
+        'segundos': round(segundos, 3),
+        'archivos_s': round(len(rutas) / segundos, 2) if segundos else None,
+        'mb_s': round(megas / segundos, 3) if segundos else None,
+        'caracteres': caracteres,
+        'omitido': '; '.join(sorted(faltan)) or None,
+    }
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Mide el rendimiento de cada extractor con corpus sintéticos")
+    parser.add_argument('--formatos', default=','.join(FORMATOS))
+    parser.add_argument('--tamanos', default=','.join(TAMANOS))
+    parser.add_argument('--archivos', type=int, default=5, help="Archivos por formato y tamaño")
+    parser.add_argument('--workers', type=int, default=0, help="0 = extraer en este proceso")
+    parser.add_argument('--carpeta', help="Conservar el corpus en esta carpeta (por defecto, temporal)")
+    parser.add_argument('--json', action='store_true', help="Emitir cada medida como una línea JSON")
+    args = parser.parse_args(argumentos)
+
+    formatos = [f for f in args.formatos.split(',') if f in GENERADORES]
+    tamanos = {t: TAMANOS[t] for t in args.tamanos.split(',') if t in TAMANOS}
+    carpeta = args.carpeta or tempfile.mkdtemp(prefix='benchmark_extractores_')
+    try:
+        corpus = generar_corpus(carpeta, formatos, tamanos, args.archivos)
+        if not args.json:
+            print(f"{'formato':8} {'tamaño':8} {'archivos':>8} {'MB':>9} {'seg':>8} "
+                  f"{'arch/s':>8} {'MB/s':>8} {'caracteres':>11}")
+        for (formato, tamano), rutas in corpus.items():
+            medida = {'formato': formato, 'tamano': tamano, **medir(rutas, args.workers)}
+            if args.json:
+                print(json.dumps(medida, ensure_ascii=False), flush=True)
+            else:
+                print(f"{formato:8} {tamano:8} {medida['archivos']:>8} {medida['mb']:>9.3f} "
+                      f"{medida['segundos']:>8.3f} {medida['archivos_s'] or 0:>8.2f} "
+                      f"{medida['mb_s'] or 0:>8.3f} {medida['caracteres']:>11}")
+            if medida['omitido']:
+                print(f"aviso: {formato} omitido por falta de dependencia ({medida['omitido']})", file=sys.stderr)
+            elif medida['caracteres'] == 0:
+                print(f"aviso: {formato} no ha producido texto (¿falta Tesseract u otra dependencia?)",
+                      file=sys.stderr)
+    finally:
+        if not args.carpeta:
+            shutil.rmtree(carpeta, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,340 @@
+import os
+import json
+import hashlib
+import sqlite3
+
+# Caché local de textos extraídos: se reutiliza mientras el archivo conserve
+# tamaño, fecha de modificación y versión del extractor.
+CACHE_DB = os.environ.get(
+    'BUSCADOR_CACHE_DB',
+    os.path.join(os.path.expanduser('~'), '.buscador_textos.db')
+)
+
+# Estado con el que queda registrado cada archivo
+ESTADO_OK = 'ok'
+ESTADO_TIEMPO = 'omitido (timeout)'
+ESTADO_MEMORIA = 'omitido (memoria)'
+ESTADO_ERROR = 'omitido (error)'
+# Falta una librería o un programa (tesseract) para extraerlo: no se guarda en
+# la caché, así se extrae de nuevo en cuanto se instale
+ESTADO_NO_DISPONIBLE = 'omitido (falta dependencia)'
+
+# Versión del esquema guardada en PRAGMA user_version; incrementar al cambiar
+# tablas, índices o triggers
+VERSION_ESQUEMA = 2
+# Espera máxima cuando otra conexión (el indexador en segundo plano) escribe
+ESPERA_BLOQUEO_MS = 30000
+
+
+def abrir_cache(ruta_db=CACHE_DB):
+    # El esquema solo se crea o actualiza si PRAGMA user_version no está al
+    # día: abrir la caché mientras el indexador escribe no necesita bloquearla
+    conn = sqlite3.connect(ruta_db)
+    conn.execute(f'PRAGMA busy_timeout={ESPERA_BLOQUEO_MS}')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    if conn.execute('PRAGMA user_version').fetchone()[0] != VERSION_ESQUEMA:
+        actualizar_esquema(conn)
+    return conn
+
+
+def actualizar_esquema(conn):
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS textos (
+            ruta TEXT PRIMARY KEY,
+            tamano INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            texto TEXT NOT NULL,
+            ubicaciones TEXT NOT NULL DEFAULT '[]',
+            estado TEXT NOT NULL DEFAULT 'ok',
+            huella TEXT
+        )
+    ''')
+    columnas = [c[1] for c in conn.execute('PRAGMA table_info(textos)')]
+    if 'ubicaciones' not in columnas:
+        conn.execute("ALTER TABLE textos ADD COLUMN ubicaciones TEXT NOT NULL DEFAULT '[]'")
+    if 'estado' not in columnas:
+        conn.execute("ALTER TABLE textos ADD COLUMN estado TEXT NOT NULL DEFAULT 'ok'")
+    if 'huella' not in columnas:
+        conn.execute("ALTER TABLE textos ADD COLUMN huella TEXT")
+    conn.execute('CREATE INDEX IF NOT EXISTS textos_tamano ON textos(tamano)')
+    conn.execute('CREATE INDEX IF NOT EXISTS textos_huella ON textos(huella)')
+    conn.commit()
+    # Índice invertido FTS5 sobre el texto cacheado (tabla de contenido externo)
+    existe_indice = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='textos_fts'"
+    ).fetchone()
+    reconstruir = '' if existe_indice else '''
+        INSERT INTO textos_fts(textos_fts) VALUES ('rebuild');
+        INSERT OR REPLACE INTO ajustes(clave, valor) VALUES ('terminos', 'pendiente');
+    '''
+    # executescript confirma lo pendiente antes de empezar: el script lleva su
+    # propia transacción, que incluye la nueva versión del esquema
+    try:
+        conn.executescript(f'''
+        BEGIN IMMEDIATE;
+        CREATE TABLE IF NOT EXISTS ajustes (clave TEXT PRIMARY KEY, valor TEXT);
+        CREATE VIRTUAL TABLE IF NOT EXISTS textos_fts USING fts5(
+            texto, content='textos', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2'
+        );
+        -- Dentro de un trigger manda la política de conflicto de la sentencia
+        -- que lo dispara (el UPSERT de guardar_cache aborta): INSERT OR REPLACE
+        -- no sirve para la marca de términos pendientes, hace falta ON CONFLICT
+        DROP TRIGGER IF EXISTS textos_ai;
+        CREATE TRIGGER textos_ai AFTER INSERT ON textos BEGIN
+            INSERT INTO textos_fts(rowid, texto) VALUES (new.rowid, new.texto);
+            INSERT INTO ajustes(clave, valor) VALUES ('terminos', 'pendiente')
+                ON CONFLICT(clave) DO UPDATE SET valor=excluded.valor;
+        END;
+        CREATE TRIGGER IF NOT EXISTS textos_ad AFTER DELETE ON textos BEGIN
+            INSERT INTO textos_fts(textos_fts, rowid, texto) VALUES ('delete', old.rowid, old.texto);
+        END;
+        DROP TRIGGER IF EXISTS textos_au;
+        CREATE TRIGGER textos_au AFTER UPDATE OF texto ON textos BEGIN
+            INSERT INTO textos_fts(textos_fts, rowid, texto) VALUES ('delete', old.rowid, old.texto);
+            INSERT INTO textos_fts(rowid, texto) VALUES (new.rowid, new.texto);
+            INSERT INTO ajustes(clave, valor) VALUES ('terminos', 'pendiente')
+                ON CONFLICT(clave) DO UPDATE SET valor=excluded.valor;
+        END;
+        -- Vocabulario del índice (ya sin acentos ni mayúsculas) con sus trigramas,
+        -- para encontrar términos parecidos a uno dado
+        CREATE VIRTUAL TABLE IF NOT EXISTS textos_vocab USING fts5vocab(textos_fts, row);
+        CREATE TABLE IF NOT EXISTS terminos (
+            id INTEGER PRIMARY KEY,
+            termino TEXT NOT NULL UNIQUE,
+            longitud INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS terminos_longitud ON terminos(longitud);
+        CREATE TABLE IF NOT EXISTS trigramas (
+            trigrama TEXT NOT NULL,
+            termino INTEGER NOT NULL,
+            PRIMARY KEY (trigrama, termino)
+        ) WITHOUT ROWID;
+        {reconstruir}
+        PRAGMA user_version={VERSION_ESQUEMA};
+        COMMIT;
+        ''')
+    except sqlite3.Error:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+
+def firma_archivo(path):
+    info = os.stat(path)
+    return info.st_size, info.st_mtime_ns
+
+
+def leer_cache(conn, path, tamano, mtime_ns, version):
+    # Devuelve (texto, ubicaciones, estado) o None si no hay entrada vigente
+    fila = conn.execute(
+        'SELECT texto, ubicaciones, estado FROM textos WHERE ruta=? AND tamano=? AND mtime_ns=? AND version=?',
+        (path, tamano, mtime_ns, version)
+    ).fetchone()
+    return (fila[0], json.loads(fila[1]), fila[2]) if fila else None
+
+
+def guardar_cache(conn, path, tamano, mtime_ns, version, texto, ubicaciones=(), estado=ESTADO_OK,
+                  huella=None):
+    # UPSERT en vez de INSERT OR REPLACE para que salte el trigger de UPDATE
+    conn.execute('''
+        INSERT INTO textos(ruta, tamano, mtime_ns, version, texto, ubicaciones, estado, huella)
+        VALUES(?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(ruta) DO UPDATE SET
+            tamano=excluded.tamano, mtime_ns=excluded.mtime_ns, version=excluded.version,
+            texto=excluded.texto, ubicaciones=excluded.ubicaciones, estado=excluded.estado,
+            huella=excluded.huella
+    ''', (path, tamano, mtime_ns, version, texto, json.dumps(list(ubicaciones)), estado, huella))
+
+
+def huella_archivo(path, bloque=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for trozo in iter(lambda: f.read(bloque), b''):
+            h.update(trozo)
+    return h.hexdigest()
+
+
+def hay_mismo_tamano(conn, path, tamano):
+    return conn.execute(
+        'SELECT 1 FROM textos WHERE tamano=? AND ruta<>? LIMIT 1', (tamano, path)
+    ).fetchone() is not None
+
+
+def buscar_copia(conn, path, tamano, huella, version):
+    # Devuelve (texto, ubicaciones, estado) de un archivo idéntico ya extraído, o
+    # None. Las huellas de los candidatos del mismo tamaño se calculan al vuelo.
+    extension = os.path.splitext(path)[1].lower()
+    candidatos = conn.execute(
+        'SELECT ruta, mtime_ns, huella FROM textos WHERE tamano=? AND version=? AND estado=? AND ruta<>?',
+        (tamano, version, ESTADO_OK, path)
+    ).fetchall()
+    for ruta, mtime_ns, huella_candidato in candidatos:
+        if os.path.splitext(ruta)[1].lower() != extension:
+            continue
+        if huella_candidato is None:
+            try:
+                if firma_archivo(ruta) != (tamano, mtime_ns):
+                    continue
+                huella_candidato = huella_archivo(ruta)
+            except OSError:
+                continue
+            conn.execute('UPDATE textos SET huella=? WHERE ruta=?', (huella_candidato, ruta))
+        if huella_candidato == huella:
+            fila = conn.execute('SELECT texto, ubicaciones, estado FROM textos WHERE ruta=?', (ruta,)).fetchone()
+            return fila[0], json.loads(fila[1]), fila[2]
+    return None
+
+
+def rango_carpeta(carpeta):
+    prefijo = os.path.join(carpeta, '')
+    return prefijo, prefijo + '\U0010ffff'
+
+
+def rutas_indexadas(conn, carpeta):
+    return [f[0] for f in conn.execute('SELECT ruta FROM textos WHERE ruta >= ? AND ruta < ?',
+                                       rango_carpeta(carpeta))]
+
+
+def olvidar_rutas(conn, rutas):
+    # Elimina las entradas de archivos borrados y de todo lo que hubiera bajo
+    # carpetas borradas o movidas
+    borrados = 0
+    for ruta in rutas:
+        borrados += conn.execute('DELETE FROM textos WHERE ruta = ? OR (ruta >= ? AND ruta < ?)',
+                                 (ruta, *rango_carpeta(ruta))).rowcount
+    conn.commit()
+    return borrados
+
+
+def purgar_cache(conn, carpeta, vistos):
+    # Elimina las entradas de la carpeta cuyos archivos ya no existen. Los no
+    # vistos en la pasada pueden existir pero haber quedado fuera por los
+    # filtros (exclusiones, tamaño máximo, ocultos): esos se conservan para
+    # no tener que extraerlos otra vez si se quita el filtro.
+    filas = conn.execute(
+        'SELECT ruta FROM textos WHERE ruta >= ? AND ruta < ?',
+        rango_carpeta(carpeta)
+    ).fetchall()
+    borrados = [(r[0],) for r in filas if r[0] not in vistos and not os.path.exists(r[0])]
+    conn.executemany('DELETE FROM textos WHERE ruta=?', borrados)
+    conn.commit()
+    return len(borrados)
+
+
+# Marcadores que delimitan los términos encontrados dentro de los fragmentos
+INICIO_RESALTE = '\x02'
+FIN_RESALTE = '\x03'
+
+
+def trigramas(termino):
+    # Con relleno, para que también las palabras cortas tengan trigramas
+    relleno = f'  {termino} '
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+def actualizar_terminos(conn, lote=5000):
+    # Añade al índice de trigramas los términos nuevos del vocabulario. Solo
+    # trabaja si se ha extraído algo desde la última vez; los términos que ya
+    # no aparecen en ningún documento se quedan (el índice FTS los descarta).
+    # Escribe por lotes para no bloquear al indexador y, si la base sigue
+    # ocupada, se conforma con los términos que ya hay.
+    pendiente = conn.execute("SELECT 1 FROM ajustes WHERE clave='terminos' AND valor='pendiente'").fetchone()
+    if not pendiente and conn.execute('SELECT 1 FROM terminos LIMIT 1').fetchone():
+        return 0
+    anadidos = 0
+    try:
+        # La marca se quita antes de leer el vocabulario: lo que se extraiga
+        # mientras tanto la vuelve a poner
+        conn.execute("DELETE FROM ajustes WHERE clave='terminos'")
+        conn.commit()
+        nuevos = conn.execute(
+            'SELECT term FROM textos_vocab WHERE term NOT IN (SELECT termino FROM terminos)'
+        ).fetchall()
+        for inicio in range(0, len(nuevos), lote):
+            for (termino,) in nuevos[inicio:inicio + lote]:
+                cursor = conn.execute('INSERT OR IGNORE INTO terminos(termino, longitud) VALUES(?, ?)',
+                                      (termino, len(termino)))
+                if cursor.rowcount:
+                    conn.executemany('INSERT OR IGNORE INTO trigramas(trigrama, termino) VALUES(?, ?)',
+                                     ((t, cursor.lastrowid) for t in trigramas(termino)))
+                    anadidos += 1
+            conn.commit()
+    except sqlite3.OperationalError:
+        conn.rollback()
+        try:
+            conn.execute("INSERT OR REPLACE INTO ajustes(clave, valor) VALUES ('terminos', 'pendiente')")
+            conn.commit()
+        except sqlite3.OperationalError:
+            conn.rollback()
+    return anadidos
+
+
+def terminos_parecidos(conn, termino, distancia):
+    # Candidatos a distancia de edición <= distancia de un término normalizado.
+    # Cada edición estropea como mucho tres trigramas; hay que verificarlos después.
+    propios = trigramas(termino)
+    minimo = len(propios) - 3 * distancia
+    longitudes = (len(termino) - distancia, len(termino) + distancia)
+    if minimo <= 0:
+        filas = conn.execute('SELECT termino FROM terminos WHERE longitud BETWEEN ? AND ?', longitudes)
+    else:
+        filas = conn.execute(f'''
+            SELECT t.termino FROM trigramas g JOIN terminos t ON t.id = g.termino
+            WHERE g.trigrama IN ({','.join('?' * len(propios))}) AND t.longitud BETWEEN ? AND ?
+            GROUP BY g.termino HAVING COUNT(*) >= ?
+        ''', (*propios, *longitudes, minimo))
+    return [f[0] for f in filas]
+
+
+def consulta_fts(palabras, todas=False, variantes=None):
+    # Cada palabra o frase se busca como prefijo de palabra del índice, junto
+    # con sus variantes aproximadas {palabra: [términos]}. No es una búsqueda
+    # por subcadena: "factura" encuentra "facturas" pero no "prefactura".
+    variantes = variantes or {}
+    terminos = []
+    for p in palabras:
+        if not p.strip():
+            continue
+        grupo = ['"' + p.replace('"', '""') + '"*'] + ['"' + v.replace('"', '""') + '"' for v in variantes.get(p, ())]
+        terminos.append(grupo[0] if len(grupo) == 1 else '(' + ' OR '.join(grupo) + ')')
+    return (' AND ' if todas else ' OR ').join(terminos)
+
+
+def buscar_indice(conn, consulta, carpeta, limite=0):
+    # Devuelve (ruta, puntuación BM25, fragmento, huella) ordenado por relevancia;
+    # todos los documentos salvo que se pida un límite (LIMIT -1 = sin límite)
+    return conn.execute('''
+        SELECT t.ruta, bm25(textos_fts) AS rango,
+               snippet(textos_fts, 0, ?, ?, '…', 24), t.huella
+        FROM textos_fts JOIN textos t ON t.rowid = textos_fts.rowid
+        WHERE textos_fts MATCH ? AND t.ruta >= ? AND t.ruta < ?
+        ORDER BY rango
+        LIMIT ?
+    ''', (INICIO_RESALTE, FIN_RESALTE, consulta, *rango_carpeta(carpeta), limite or -1)).fetchall()
+
+
+def leer_documento(conn, path):
+    fila = conn.execute('SELECT texto, ubicaciones FROM textos WHERE ruta=?', (path,)).fetchone()
+    return (fila[0], json.loads(fila[1])) if fila else ('', [])
+
+
+def segmentos_documento(conn, path):
+    # Genera (etiqueta, unidad, texto) por página/hoja del documento cacheado,
+    # leyendo de la base solo el trozo de cada una (substr cuenta caracteres,
+    # como los desplazamientos de las ubicaciones). Quien deja de consumir el
+    # generador no llega a cargar el resto del documento.
+    fila = conn.execute('SELECT rowid, ubicaciones, length(texto) FROM textos WHERE ruta=?', (path,)).fetchone()
+    if fila is None:
+        return
+    rowid, longitud = fila[0], fila[2]
+    ubicaciones = json.loads(fila[1]) or [[0, '', 'línea']]
+    for n, (desde, etiqueta, unidad) in enumerate(ubicaciones):
+        hasta = ubicaciones[n + 1][0] - 1 if n + 1 < len(ubicaciones) else longitud
+        trozo = conn.execute('SELECT substr(texto, ?, ?) FROM textos WHERE rowid=?',
+                             (desde + 1, max(0, hasta - desde), rowid)).fetchone()
+        if trozo is None:
+            return
+        yield etiqueta, unidad, trozo[0]
@@ -0,0 +1,150 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.decomposition import PCA
+from sklearn.metrics import silhouette_score
+from sklearn.preprocessing import StandardScaler
+
+# Clustering del analizador: las columnas se estandarizan y, en modo escalable,
+# el modelo se ajusta con MiniBatchKMeans sobre una muestra (estratificada si
+# se indica una columna de grupos) y después se asigna cada fila a su cluster.
+# La preparación (escalado, muestra, PCA) y cada modelo se guardan por clave
+# (columnas, estado de filtros, k) para que las recargas no vuelvan a ajustar.
+
+MUESTRA_AJUSTE = 50_000
+MUESTRA_SILUETA = 5_000
+PUNTOS_GRAFICO = 20_000
+LOTE_MINIBATCH = 4096
+SEMILLA = 42
+MODELOS_MAX = 8
+
+
+def clave_filtros(filtros):
+    # Estado de los filtros como tupla ordenada, utilizable como clave
+    return tuple(sorted(
+        (col, tuple(sorted(valor)) if isinstance(valor, list) else
+         tuple(valor) if isinstance(valor, tuple) else valor)
+        for col, valor in filtros.items()
+    ))
+
+
+def matriz_numerica(df, columnas):
+    # (matriz float64 sin filas con vacíos, posiciones en df de las filas usadas)
+    datos = np.column_stack([df[c].to_numpy(dtype=np.float64, na_value=np.nan) for c in columnas])
+    validas = ~np.isnan(datos).any(axis=1)
+    return datos[validas], np.flatnonzero(validas)
+
+
+def muestra_estratificada(n, tamano, grupos=None, semilla=SEMILLA):
+    # Posiciones ordenadas de una muestra de 'tamano' de las n filas. Con grupos
+    # (un código por fila) cada grupo aporta en proporción a su tamaño y al
+    # menos una fila, así los grupos pequeños no desaparecen de la muestra.
+    if tamano is None or tamano >= n:
+        return np.arange(n)
+    rng = np.random.default_rng(semilla)
+    if grupos is None:
+        return np.sort(rng.choice(n, tamano, replace=False))
+    _, codigos, cuentas = np.unique(grupos, return_inverse=True, return_counts=True)
+    cupo = np.maximum(1, cuentas * tamano // n)
+    # Orden aleatorio dentro de cada grupo; se quedan las primeras 'cupo' filas
+    orden = np.lexsort((rng.random(n), codigos))
+    inicio = np.concatenate(([0], np.cumsum(cuentas)[:-1]))
+    puesto = np.arange(n) - inicio[codigos[orden]]
+    return np.sort(orden[puesto < cupo[codigos[orden]]])
+
+
+def preparar_clustering(df, columnas, grupos=None, tamano_muestra=MUESTRA_AJUSTE):
+    # Escalado, muestra de ajuste y proyección PCA 2D de los puntos a dibujar;
+    # no depende de k, así que se reutiliza al mover el número de clusters.
+    # grupos: serie de df para estratificar la muestra, o None.
+    datos, posiciones = matriz_numerica(df, columnas)
+    escalador = StandardScaler().fit(datos) if len(datos) else None
+    escalados = escalador.transform(datos) if len(datos) else datos
+    codigos = pd.factorize(grupos)[0][posiciones] if grupos is not None else None
+    muestra = muestra_estratificada(len(datos), tamano_muestra, codigos)
+    puntos = muestra[muestra_estratificada(len(muestra), PUNTOS_GRAFICO,
+                                           codigos[muestra] if codigos is not None else None)]
+    preparado = {'columnas': list(columnas), 'filas': len(datos), 'posiciones': posiciones,
+                 'escalador': escalador, 'datos': escalados, 'muestra': muestra, 'puntos': puntos,
+                 'pca': None, 'proyeccion': None, 'varianza': None}
+    if len(muestra) >= 2:
+        pca = preparado['pca'] = PCA(n_components=2).fit(escalados[muestra])
+        preparado['proyeccion'] = pca.transform(escalados[puntos])
+        preparado['varianza'] = pca.explained_variance_ratio_
+    return preparado
+
+
+def proyeccion_completa(preparado):
+    # Proyección PCA de todas las filas, para los gráficos de densidad
+    return preparado['pca'].transform(preparado['datos'])
+
+
+def ajustar_kmeans(preparado, k, escalable=True):
+    # Escalable: MiniBatchKMeans sobre la muestra y asignación de todas las
+    # filas; si no, KMeans completo sobre todas las filas
+    escalados = preparado['datos']
+    if escalable:
+        modelo = MiniBatchKMeans(n_clusters=k, batch_size=LOTE_MINIBATCH, n_init=3,
+                                 random_state=SEMILLA).fit(escalados[preparado['muestra']])
+        etiquetas = modelo.predict(escalados)
+    else:
+        modelo = KMeans(n_clusters=k, n_init=10, random_state=SEMILLA).fit(escalados)
+        etiquetas = modelo.labels_
+    centros = pd.DataFrame(preparado['escalador'].inverse_transform(modelo.cluster_centers_),
+                           columns=preparado['columnas'])
+    centros.insert(0, 'filas', np.bincount(etiquetas, minlength=k))
+    centros.index.name = 'cluster'
+    return {'k': k, 'etiquetas': etiquetas.astype(np.int32), 'centros': centros, 'inercia': modelo.inertia_}
+
+
+def barrido_k(preparado, ks, workers=None):
+    # Genera (k, inercia, silueta) según terminan los ajustes, en paralelo con
+    # hilos (el cálculo de sklearn libera el GIL). Ajusta sobre la muestra y
+    # la silueta se estima con como mucho MUESTRA_SILUETA filas de ella.
+    escalados = preparado['datos'][preparado['muestra']]
+    evaluadas = escalados[muestra_estratificada(len(escalados), MUESTRA_SILUETA)]
+
+    def evaluar(k):
+        modelo = MiniBatchKMeans(n_clusters=k, batch_size=LOTE_MINIBATCH, n_init=3,
+                                 random_state=SEMILLA).fit(escalados)
+        etiquetas = modelo.predict(evaluadas)
+        distintas = len(np.unique(etiquetas))
+        silueta = silhouette_score(evaluadas, etiquetas) if 1 < distintas < len(evaluadas) else np.nan
+        return k, modelo.inertia_, silueta
+
+    with ThreadPoolExecutor(max_workers=workers or min(len(ks), os.cpu_count() or 1)) as ejecutor:
+        futuros = [ejecutor.submit(evaluar, k) for k in ks]
+        for futuro in as_completed(futuros):
+            yield futuro.result()
+
+
+class CacheModelos:
+    # LRU de preparaciones y modelos ajustados; las entradas guardan matrices
+    # del tamaño de los datos filtrados, de ahí el tope de entradas
+
+    def __init__(self, maximo=MODELOS_MAX):
+        self.maximo = maximo
+        self.entradas = OrderedDict()
+
+    def obtener(self, clave):
+        valor = self.entradas.get(clave)
+        if valor is not None:
+            self.entradas.move_to_end(clave)
+        return valor
+
+    def guardar(self, clave, valor):
+        self.entradas[clave] = valor
+        self.entradas.move_to_end(clave)
+        while len(self.entradas) > self.maximo:
+            self.entradas.popitem(last=False)
+
+    def obtener_o_calcular(self, clave, calcular):
+        valor = self.obtener(clave)
+        if valor is None:
+            valor = calcular()
+            self.guardar(clave, valor)
+        return valor
@@ -0,0 +1,211 @@
+import re
+import unicodedata
+from functools import lru_cache
+from collections import deque
+
+from cache_textos import INICIO_RESALTE, FIN_RESALTE
+
+PALABRA = re.compile(r'\w+')
+
+
+@lru_cache(maxsize=4096)
+def normalizar_caracter(caracter):
+    # Sin mayúsculas ni diacríticos, con NFKD: 'Á' -> 'a', 'ß' -> 'ss', 'ﬁ' -> 'fi'
+    return ''.join(c for c in unicodedata.normalize('NFKD', caracter.casefold())
+                   if not unicodedata.combining(c))
+
+
+def normalizar(texto):
+    if texto.isascii():
+        return texto.lower()
+    return ''.join(map(normalizar_caracter, texto))
+
+
+def distancia_edicion(a, b, maximo):
+    # Levenshtein acotado: devuelve maximo + 1 en cuanto se sabe que lo supera
+    if abs(len(a) - len(b)) > maximo:
+        return maximo + 1
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        actual = [i]
+        for j, cb in enumerate(b, 1):
+            actual.append(min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + (ca != cb)))
+        if min(actual) > maximo:
+            return maximo + 1
+        anterior = actual
+    return min(anterior[-1], maximo + 1)
+
+
+def aproximable(normalizada, distancia):
+    # Solo palabras sueltas y lo bastante largas: con 'de' y una errata casaría todo
+    return distancia > 0 and len(normalizada) > 3 * distancia and PALABRA.fullmatch(normalizada) is not None
+
+
+class BuscadorPalabras:
+    # Autómata Aho-Corasick: encuentra todas las palabras en una sola pasada
+    # sobre el texto, sin copias normalizadas del documento completo. Ignora
+    # mayúsculas y acentos; las posiciones son siempre las del texto original.
+
+    def __init__(self, palabras):
+        self.palabras = [p for p in dict.fromkeys(palabras) if p]
+        self.longitudes = {p: len(normalizar(p)) for p in self.palabras}
+        self.longitud_max = max(self.longitudes.values(), default=1)
+        self.transiciones = [{}]
+        self.fallo = [0]
+        self.salidas = [[]]
+        for palabra in self.palabras:
+            estado = 0
+            for c in normalizar(palabra):
+                siguiente = self.transiciones[estado].get(c)
+                if siguiente is None:
+                    siguiente = len(self.transiciones)
+                    self.transiciones[estado][c] = siguiente
+                    self.transiciones.append({})
+                    self.fallo.append(0)
+                    self.salidas.append([])
+                estado = siguiente
+            self.salidas[estado].append(palabra)
+
+        cola = deque(self.transiciones[0].values())
+        while cola:
+            estado = cola.popleft()
+            for c, siguiente in self.transiciones[estado].items():
+                cola.append(siguiente)
+                f = self.fallo[estado]
+                while f and c not in self.transiciones[f]:
+                    f = self.fallo[f]
+                destino = self.transiciones[f].get(c, 0)
+                self.fallo[siguiente] = destino if destino != siguiente else 0
+                self.salidas[siguiente] = self.salidas[siguiente] + self.salidas[self.fallo[siguiente]]
+
+    def buscar(self, texto):
+        # Genera (inicio, fin, palabra) para cada aparición, solapadas incluidas.
+        # 'origen' recuerda de qué carácter original sale cada carácter normalizado.
+        transiciones, fallo, salidas, longitudes = self.transiciones, self.fallo, self.salidas, self.longitudes
+        origen = deque(maxlen=self.longitud_max)
+        estado = 0
+        for i, caracter in enumerate(texto):
+            for c in caracter.lower() if caracter.isascii() else normalizar_caracter(caracter):
+                origen.append(i)
+                while estado and c not in transiciones[estado]:
+                    estado = fallo[estado]
+                estado = transiciones[estado].get(c, 0)
+                for palabra in salidas[estado]:
+                    yield origen[-longitudes[palabra]], i + 1, palabra
+
+
+class BuscadorAproximado(BuscadorPalabras):
+    # Además de las apariciones exactas, marca las palabras del texto a una
+    # distancia de edición <= distancia de alguna de las buscadas (erratas, OCR)
+
+    def __init__(self, palabras, distancia=1):
+        super().__init__(palabras)
+        self.distancia = distancia
+        self.aproximables = [(p, normalizar(p)) for p in self.palabras if aproximable(normalizar(p), distancia)]
+        self.vistas = {}
+
+    def parecidas(self, token):
+        encontradas = self.vistas.get(token)
+        if encontradas is None:
+            if len(self.vistas) > 100000:
+                self.vistas.clear()
+            normalizado = normalizar(token)
+            # Las que contienen la palabra exacta ya las da el autómata
+            encontradas = self.vistas[token] = [
+                p for p, n in self.aproximables
+                if n not in normalizado and distancia_edicion(n, normalizado, self.distancia) <= self.distancia
+            ]
+        return encontradas
+
+    def buscar(self, texto):
+        if not self.aproximables:
+            yield from super().buscar(texto)
+            return
+        apariciones = list(super().buscar(texto))
+        for m in PALABRA.finditer(texto):
+            for palabra in self.parecidas(m.group()):
+                apariciones.append((m.start(), m.end(), palabra))
+        apariciones.sort()
+        yield from apariciones
+
+
+def dividir_segmentos(texto, ubicaciones):
+    # Recorre el texto cacheado por página/hoja según las ubicaciones guardadas
+    if not ubicaciones:
+        yield '', 'línea', texto
+        return
+    for n, (desde, etiqueta, unidad) in enumerate(ubicaciones):
+        hasta = ubicaciones[n + 1][0] - 1 if n + 1 < len(ubicaciones) else len(texto)
+        yield etiqueta, unidad, texto[desde:hasta]
+
+
+def describir_ubicacion(etiqueta, unidad, texto, inicio):
+    linea = f'{unidad} {texto.count(chr(10), 0, inicio) + 1}'
+    return f'{etiqueta}, {linea}' if etiqueta else linea
+
+
+def marcar(texto, desde, hasta, apariciones):
+    # Recorta texto[desde:hasta] delimitando las apariciones con INICIO_RESALTE/FIN_RESALTE
+    partes = []
+    posicion = desde
+    for inicio, fin in sorted(apariciones):
+        inicio, fin = max(inicio, posicion), min(fin, hasta)
+        if fin <= inicio:
+            continue
+        partes += [texto[posicion:inicio], INICIO_RESALTE, texto[inicio:fin], FIN_RESALTE]
+        posicion = fin
+    partes.append(texto[posicion:hasta])
+    return ''.join(partes)
+
+
+def quitar_resaltes(fragmento):
+    # Inversa de marcar: (texto sin marcadores, [[inicio, fin], ...] de cada aparición en él)
+    partes = []
+    resaltes = []
+    longitud = 0
+    for n, trozo in enumerate(fragmento.split(INICIO_RESALTE)):
+        resaltado, _, resto = trozo.rpartition(FIN_RESALTE) if n else ('', '', trozo)
+        if resaltado:
+            resaltes.append([longitud, longitud + len(resaltado)])
+        partes += [resaltado, resto]
+        longitud += len(resaltado) + len(resto)
+    return ''.join(partes), resaltes
+
+
+def resumir_coincidencias(buscador, segmentos, max_fragmentos=3, max_coincidencias=0,
+                          antes=30, despues=70):
+    # Consume los segmentos en flujo y devuelve
+    # {palabra: {'ocurrencias': n, 'fragmentos': [(ubicación, fragmento), ...]}}.
+    # Los fragmentos llevan las apariciones marcadas con INICIO_RESALTE/FIN_RESALTE.
+    # Con max_coincidencias > 0 deja de pedir segmentos al alcanzar ese número.
+    resumen = {}
+    total = 0
+    for etiqueta, unidad, texto in segmentos:
+        abiertas = {}
+
+        def cerrar(palabra):
+            desde, hasta, inicio, apariciones = abiertas.pop(palabra)
+            resumen[palabra]['fragmentos'].append(
+                (describir_ubicacion(etiqueta, unidad, texto, inicio), marcar(texto, desde, hasta, apariciones)))
+
+        for inicio, fin, palabra in buscador.buscar(texto):
+            datos = resumen.setdefault(palabra, {'ocurrencias': 0, 'fragmentos': []})
+            datos['ocurrencias'] += 1
+            total += 1
+            desde, hasta = max(0, inicio - antes), fin + despues
+            ventana = abiertas.get(palabra)
+            if ventana and fin <= ventana[1]:
+                # Ya visible en el fragmento anterior
+                ventana[3].append((inicio, fin))
+            else:
+                if ventana:
+                    cerrar(palabra)
+                if len(datos['fragmentos']) < max_fragmentos:
+                    abiertas[palabra] = [desde, hasta, inicio, [(inicio, fin)]]
+            if max_coincidencias and total >= max_coincidencias:
+                break
+        for palabra in list(abiertas):
+            cerrar(palabra)
+        if max_coincidencias and total >= max_coincidencias:
+            break
+    return resumen
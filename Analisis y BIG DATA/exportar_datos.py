@@ -0,0 +1,93 @@
+import gzip
+import tempfile
+
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+
+# Exportación de los resultados filtrados: solo se genera cuando se pide la
+# descarga y se escribe por trozos en un archivo temporal, de modo que nunca
+# hay a la vez una copia completa en texto y otra en bytes de la tabla.
+FILAS_TROZO_EXPORTACION = 100_000
+# Excel admite 1.048.576 filas contando el encabezado
+FILAS_MAX_EXCEL = 1_048_575
+
+# Formato: (extensión, tipo MIME)
+FORMATOS = {
+    "Excel (.xlsx)": ('xlsx', "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV (.csv)": ('csv', "text/csv"),
+    "CSV comprimido (.csv.gz)": ('csv.gz', "application/gzip"),
+    "Parquet (.parquet)": ('parquet', "application/vnd.apache.parquet"),
+}
+
+
+def formatos_disponibles(filas):
+    # Excel solo si cabe en una hoja y Parquet solo si hay pyarrow
+    return [f for f, (extension, _) in FORMATOS.items()
+            if not (extension == 'xlsx' and filas > FILAS_MAX_EXCEL)
+            and not (extension == 'parquet' and pyarrow is None)]
+
+
+def trozos(df, filas=FILAS_TROZO_EXPORTACION):
+    for inicio in range(0, len(df), filas):
+        yield df.iloc[inicio:inicio + filas]
+
+
+def escribir_csv(df, salida):
+    # salida binaria: el texto se codifica trozo a trozo
+    for n, trozo in enumerate(trozos(df)):
+        trozo.to_csv(salida, index=False, header=n == 0, encoding='utf-8')
+    if not len(df):
+        df.to_csv(salida, index=False, encoding='utf-8')
+
+
+def escribir_excel(df, salida):
+    # Libro de solo escritura: las filas se vuelcan al archivo según se añaden
+    from openpyxl import Workbook
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet()
+    hoja.append([str(c) for c in df.columns])
+    for trozo in trozos(df):
+        # Valores de Python, con None en los vacíos
+        trozo = trozo.astype(object)
+        for fila in trozo.where(trozo.notna(), None).itertuples(index=False, name=None):
+            hoja.append(fila)
+    libro.save(salida)
+
+
+def escribir_parquet(df, salida):
+    # Un grupo de filas por trozo, con el esquema del primero
+    escritor = None
+    try:
+        for trozo in trozos(df):
+            tabla = pyarrow.Table.from_pandas(trozo, schema=escritor.schema if escritor else None,
+                                              preserve_index=False)
+            if escritor is None:
+                escritor = pq.ParquetWriter(salida, tabla.schema, compression='zstd')
+            escritor.write_table(tabla)
+        if escritor is None:
+            pq.write_table(pyarrow.Table.from_pandas(df, preserve_index=False), salida, compression='zstd')
+    finally:
+        if escritor is not None:
+            escritor.close()
+
+
+def exportar(df: pd.DataFrame, formato: str):
+    # Archivo temporal abierto y rebobinado con df en el formato indicado
+    extension = FORMATOS[formato][0]
+    salida = tempfile.TemporaryFile()
+    if extension == 'xlsx':
+        escribir_excel(df, salida)
+    elif extension == 'csv':
+        escribir_csv(df, salida)
+    elif extension == 'csv.gz':
+        with gzip.GzipFile(fileobj=salida, mode='wb', compresslevel=6) as comprimido:
+            escribir_csv(df, comprimido)
+    else:
+        escribir_parquet(df, salida)
+    salida.seek(0)
+    return salida
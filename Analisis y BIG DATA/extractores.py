@@ -0,0 +1,575 @@
+import os
+import csv
+import time
+import signal
+import string
+import shutil
+import warnings
+import importlib
+import multiprocessing
+from multiprocessing.connection import wait
+
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from cache_textos import (firma_archivo, leer_cache, guardar_cache, huella_archivo, hay_mismo_tamano,
+                          buscar_copia, ESTADO_OK, ESTADO_TIEMPO, ESTADO_MEMORIA, ESTADO_ERROR,
+                          ESTADO_NO_DISPONIBLE)
+from telemetria import ORIGEN_EXTRAIDO, ORIGEN_CACHE, ORIGEN_COPIA
+
+# Incrementar si cambia la forma de extraer texto para invalidar la caché
+VERSION_EXTRACTOR = 4
+
+# Ruta de Tesseract: variable de entorno TESSERACT_CMD, el PATH o la
+# instalación por defecto de Windows
+TESSERACT_WINDOWS = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+class HerramientaNoDisponible(Exception):
+    # Falta un programa externo que necesita el extractor
+    pass
+
+def ruta_tesseract():
+    ruta = os.environ.get('TESSERACT_CMD') or shutil.which('tesseract') or TESSERACT_WINDOWS
+    if not shutil.which(ruta):
+        raise HerramientaNoDisponible(f"No se encuentra tesseract: {ruta}")
+    return ruta
+
+# Registro de extractores por extensión. Cada extractor genera (etiqueta,
+# unidad, texto) por página, hoja, fila o párrafo, para no tener el documento
+# completo en memoria más de una vez; 'unidad' indica qué representa cada
+# línea del texto dentro de la etiqueta. Las librerías pesadas se importan
+# dentro de cada extractor, la primera vez que se usa.
+EXTRACTORES = {}
+
+def registrar_extractor(*extensiones):
+    # Decorador para añadir formatos, también desde módulos externos listados
+    # en la variable de entorno BUSCADOR_PLUGINS (separados por coma)
+    def decorador(funcion):
+        for ext in extensiones:
+            EXTRACTORES[ext.lower().lstrip('.')] = funcion
+        return funcion
+    return decorador
+
+# OCR: las imágenes se llevan a una resolución equivalente a DPI_OCR, con el
+# lado mayor limitado para no disparar el tiempo de Tesseract, y se binarizan
+DPI_OCR = 300
+LADO_MIN_OCR = 1000
+LADO_MAX_OCR = 4000
+
+def is_ocr_reliable(txt):
+    letras = sum([1 for c in txt if c in string.ascii_letters])
+    return letras > 20
+
+def umbral_otsu(histograma):
+    # Umbral que maximiza la varianza entre fondo y tinta
+    total = sum(histograma)
+    suma_total = sum(i * h for i, h in enumerate(histograma))
+    suma_fondo = peso_fondo = 0
+    mejor, umbral = -1, 128
+    for i, h in enumerate(histograma):
+        peso_fondo += h
+        if not peso_fondo:
+            continue
+        peso_tinta = total - peso_fondo
+        if not peso_tinta:
+            break
+        suma_fondo += i * h
+        media_fondo = suma_fondo / peso_fondo
+        media_tinta = (suma_total - suma_fondo) / peso_tinta
+        varianza = peso_fondo * peso_tinta * (media_fondo - media_tinta) ** 2
+        if varianza > mejor:
+            mejor, umbral = varianza, i
+    return umbral
+
+def preparar_imagen_ocr(img, dpi=None):
+    # Escala de grises, escalado a DPI_OCR y binarización
+    from PIL import Image, ImageOps
+    img = ImageOps.exif_transpose(img).convert('L')
+    dpi = dpi or (img.info.get('dpi') or (0,))[0]
+    factor = DPI_OCR / dpi if dpi else 1
+    lado = max(img.size) * factor
+    if lado < LADO_MIN_OCR:
+        factor *= LADO_MIN_OCR / lado
+    elif lado > LADO_MAX_OCR:
+        factor *= LADO_MAX_OCR / lado
+    if abs(factor - 1) > 0.05:
+        img = img.resize((max(1, round(img.width * factor)), max(1, round(img.height * factor))),
+                         Image.LANCZOS if factor < 1 else Image.BICUBIC)
+    img = ImageOps.autocontrast(img)
+    umbral = umbral_otsu(img.histogram())
+    return img.point(lambda v: 255 if v > umbral else 0, '1')
+
+def ocr_imagen(img, dpi=None):
+    import pytesseract
+    pytesseract.pytesseract.tesseract_cmd = ruta_tesseract()
+    try:
+        return pytesseract.image_to_string(preparar_imagen_ocr(img, dpi))
+    except pytesseract.TesseractNotFoundError as e:
+        raise HerramientaNoDisponible(str(e)) from e
+
+@registrar_extractor('pdf')
+def segmentos_pdf(path):
+    # Solo se pasa por OCR las páginas escaneadas: sin capa de texto fiable y con
+    # imágenes. Sin tesseract esas páginas se quedan con su capa de texto y la
+    # ubicación lo indica ('sin OCR'); el resto del documento no se pierde.
+    import pdfplumber
+    ocr_disponible = True
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        with pdfplumber.open(path) as pdf:
+            for n, page in enumerate(pdf.pages, 1):
+                texto = page.extract_text() or ''
+                etiqueta = f'pág. {n}'
+                if not is_ocr_reliable(texto) and page.images:
+                    texto_ocr = None
+                    if ocr_disponible:
+                        try:
+                            # Se comprueba antes de dibujar la página, que es lo caro
+                            ruta_tesseract()
+                            texto_ocr = ocr_imagen(page.to_image(resolution=DPI_OCR).original, DPI_OCR)
+                        except (ImportError, HerramientaNoDisponible):
+                            ocr_disponible = False
+                    if texto_ocr is None:
+                        etiqueta = f'pág. {n} (sin OCR)'
+                    elif len(texto_ocr.strip()) > len(texto.strip()):
+                        yield f'pág. {n} (OCR)', 'línea', texto_ocr
+                        page.close()
+                        continue
+                yield etiqueta, 'línea', texto
+                page.close()
+
+@registrar_extractor('png', 'jpg', 'jpeg')
+def segmentos_imagen(path):
+    from PIL import Image
+    with Image.open(path) as img:
+        # Las fotos grandes se decodifican ya reducidas; el DPI se corrige en proporción
+        ancho = img.width
+        img.draft('L', (LADO_MAX_OCR, LADO_MAX_OCR))
+        dpi = (img.info.get('dpi') or (0,))[0] * img.width / ancho
+        yield '', 'línea', ocr_imagen(img, dpi or None)
+
+@registrar_extractor('docx')
+def segmentos_docx(path):
+    import docx
+    doc = docx.Document(path)
+    for para in doc.paragraphs:
+        yield '', 'párrafo', para.text
+
+@registrar_extractor('odt')
+def segmentos_odt(path):
+    from odf.opendocument import load
+    from odf.text import P
+    odt = load(path)
+    for elem in odt.getElementsByType(P):
+        yield '', 'párrafo', str(elem)
+
+@registrar_extractor('xlsx')
+def segmentos_xlsx(path):
+    import openpyxl
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in wb.worksheets:
+            for row in sheet.iter_rows(values_only=True):
+                yield f'hoja {sheet.title}', 'fila', ' '.join(str(c) if c is not None else '' for c in row)
+    finally:
+        wb.close()
+
+@registrar_extractor('xls')
+def segmentos_xls(path):
+    # Excel 97-2003: openpyxl no lo lee, hace falta xlrd
+    import xlrd
+    wb = xlrd.open_workbook(path, on_demand=True)
+    try:
+        for sheet in wb.sheets():
+            for n in range(sheet.nrows):
+                yield f'hoja {sheet.name}', 'fila', ' '.join(str(c) for c in sheet.row_values(n))
+            wb.unload_sheet(sheet.name)
+    finally:
+        wb.release_resources()
+
+@registrar_extractor('txt')
+def segmentos_txt(path):
+    with open(path, 'r', encoding='utf8', errors='ignore') as f:
+        for linea in f:
+            yield '', 'línea', linea.rstrip('\n')
+
+@registrar_extractor('pptx')
+def segmentos_pptx(path):
+    import pptx
+    prs = pptx.Presentation(path)
+    for n, slide in enumerate(prs.slides, 1):
+        texts = [shape.text for shape in slide.shapes if hasattr(shape, "text")]
+        yield f'diapositiva {n}', 'línea', '\n'.join(texts)
+
+@registrar_extractor('csv')
+def segmentos_csv(path):
+    with open(path, 'r', encoding='utf8', errors='ignore') as f:
+        for row in csv.reader(f):
+            yield '', 'fila', ' '.join(row)
+
+def texto_html(html):
+    from html.parser import HTMLParser
+
+    class _Texto(HTMLParser):
+        def __init__(self):
+            super().__init__()
+            self.partes = []
+            self.ignorar = 0
+
+        def handle_starttag(self, tag, attrs):
+            if tag in ('script', 'style'):
+                self.ignorar += 1
+
+        def handle_endtag(self, tag):
+            if tag in ('script', 'style') and self.ignorar:
+                self.ignorar -= 1
+
+        def handle_data(self, data):
+            if not self.ignorar and data.strip():
+                self.partes.append(data.strip())
+
+    lector = _Texto()
+    lector.feed(html)
+    lector.close()
+    return '\n'.join(lector.partes)
+
+@registrar_extractor('html', 'htm')
+def segmentos_html(path):
+    with open(path, 'r', encoding='utf8', errors='ignore') as f:
+        yield '', 'línea', texto_html(f.read())
+
+@registrar_extractor('eml')
+def segmentos_eml(path):
+    from email import policy
+    from email.parser import BytesParser
+    with open(path, 'rb') as f:
+        mensaje = BytesParser(policy=policy.default).parse(f)
+    cabeceras = [f'{campo}: {mensaje[campo]}' for campo in ('From', 'To', 'Cc', 'Date', 'Subject') if mensaje[campo]]
+    yield 'cabecera', 'línea', '\n'.join(cabeceras)
+    for parte in mensaje.walk():
+        if parte.is_multipart() or parte.get_content_maintype() != 'text':
+            continue
+        contenido = parte.get_content()
+        if parte.get_content_subtype() == 'html':
+            contenido = texto_html(contenido)
+        yield 'cuerpo', 'línea', contenido
+
+def cargar_plugins(modulos=None):
+    # Importa los módulos que registran formatos adicionales. Se hace al
+    # importar este módulo para que los procesos de extracción también los vean.
+    modulos = os.environ.get('BUSCADOR_PLUGINS', '') if modulos is None else modulos
+    for modulo in (m.strip() for m in modulos.split(',')):
+        if modulo:
+            importlib.import_module(modulo)
+
+def extension_soportada(path):
+    return path.lower().rsplit('.', 1)[-1] in EXTRACTORES
+
+def segmentos_archivo(path):
+    extractor = EXTRACTORES.get(path.lower().rsplit('.', 1)[-1])
+    return extractor(path) if extractor else iter(())
+
+def extraer_documento(path):
+    # (texto, ubicaciones); vacío si falta la librería o el programa necesarios
+    try:
+        return extraer_con_error(path)[:2]
+    except (ImportError, HerramientaNoDisponible):
+        return '', []
+
+def extraer_con_error(path):
+    # Une los segmentos en un único texto y devuelve dónde empieza cada
+    # página/hoja como [desplazamiento, etiqueta, unidad], más el tipo de error
+    # o None. Cualquier error del extractor deja el documento vacío, salvo
+    # MemoryError y la falta de una librería (ImportError) o de un programa
+    # (HerramientaNoDisponible), que se propagan: no son culpa del archivo y
+    # no deben quedar en caché como documento vacío.
+    partes = []
+    ubicaciones = []
+    desplazamiento = 0
+    actual = None
+    try:
+        for etiqueta, unidad, texto in segmentos_archivo(path):
+            if unidad != 'línea':
+                texto = texto.replace('\n', ' ')
+            if (etiqueta, unidad) != actual:
+                ubicaciones.append([desplazamiento, etiqueta, unidad])
+                actual = (etiqueta, unidad)
+            partes.append(texto)
+            desplazamiento += len(texto) + 1
+    except (MemoryError, ImportError, HerramientaNoDisponible):
+        raise
+    except Exception as e:
+        return '', [], type(e).__name__
+    return '\n'.join(partes), ubicaciones, None
+
+def extraer_texto_archivo(path):
+    return extraer_documento(path)[0]
+
+# Sin psutil el límite de memoria solo puede ser de espacio de direcciones
+# (RLIMIT_AS), que cuenta memoria reservada y no usada (pilas de hilos, arenas
+# de numpy/OpenBLAS): se aplica con este margen sobre el límite pedido
+FACTOR_MEMORIA_VIRTUAL = 4
+
+def _trabajador(conexion, limite_memoria_mb):
+    # Proceso de extracción: recibe rutas por la tubería y devuelve
+    # (texto, ubicaciones, estado, medida) hasta recibir None. Tiene su propio
+    # grupo de procesos para poder matar también lo que lance (tesseract).
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    if limite_memoria_mb and psutil is None and resource is not None:
+        try:
+            _, maximo = resource.getrlimit(resource.RLIMIT_AS)
+            limite = limite_memoria_mb * FACTOR_MEMORIA_VIRTUAL * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limite if maximo == resource.RLIM_INFINITY else
+                                                    min(limite, maximo), maximo))
+        except (ValueError, OSError):
+            pass
+    while True:
+        try:
+            path = conexion.recv()
+        except EOFError:
+            break
+        if path is None:
+            break
+        inicio = time.perf_counter()
+        try:
+            texto, ubicaciones, error = extraer_con_error(path)
+            estado = ESTADO_OK
+        except MemoryError:
+            texto, ubicaciones, error, estado = '', [], 'MemoryError', ESTADO_MEMORIA
+        except (ImportError, HerramientaNoDisponible) as e:
+            texto, ubicaciones, error, estado = '', [], type(e).__name__, ESTADO_NO_DISPONIBLE
+        conexion.send((texto, ubicaciones, estado, {'segundos': time.perf_counter() - inicio, 'error': error}))
+
+def memoria_proceso_mb(pid):
+    # Memoria residente del proceso más la de sus hijos (tesseract)
+    if psutil is None:
+        return 0
+    try:
+        proceso = psutil.Process(pid)
+        procesos = [proceso] + proceso.children(recursive=True)
+    except psutil.Error:
+        return 0
+    total = 0
+    for p in procesos:
+        try:
+            total += p.memory_info().rss
+        except psutil.Error:
+            pass
+    return total / (1024 * 1024)
+
+def matar_arbol(proceso):
+    # Mata el proceso de extracción y lo que haya lanzado: con psutil, sus
+    # hijos en cualquier sistema; en POSIX, además, todo su grupo de procesos
+    hijos = []
+    if psutil is not None:
+        try:
+            hijos = psutil.Process(proceso.pid).children(recursive=True)
+        except psutil.Error:
+            pass
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(proceso.pid, signal.SIGKILL)
+        except OSError:
+            pass
+    proceso.kill()
+    for hijo in hijos:
+        try:
+            hijo.kill()
+        except psutil.Error:
+            pass
+
+def extraer_en_procesos(tareas, workers=None, limite_segundos=0, limite_memoria_mb=0):
+    # tareas: (ruta, documento) donde documento es (texto, ubicaciones, estado) si
+    # ya se conoce o None si hay que extraerlo. Devuelve (ruta, texto, ubicaciones,
+    # estado, medida) en orden de finalización; medida es {'segundos', 'error'}
+    # para lo extraído y None para lo ya conocido. Cada archivo se extrae en un
+    # proceso con límite de tiempo y de memoria residente (0 = sin límite); el
+    # que se pasa se mata junto con sus hijos y se sustituye por otro nuevo.
+    workers = workers or os.cpu_count() or 1
+    contexto = multiprocessing.get_context()
+    tareas = iter(tareas)
+    procesos = {}
+    en_curso = {}
+    libres = []
+    cola = []
+    agotado = False
+
+    def arrancar():
+        propia, remota = contexto.Pipe()
+        proceso = contexto.Process(target=_trabajador, args=(remota, limite_memoria_mb), daemon=True)
+        proceso.start()
+        remota.close()
+        procesos[propia] = proceso
+        return propia
+
+    def descartar(conexion):
+        proceso = procesos.pop(conexion)
+        matar_arbol(proceso)
+        proceso.join()
+        conexion.close()
+
+    try:
+        while True:
+            # Los documentos ya resueltos salen sin esperar; se adelanta trabajo
+            # suficiente para mantener ocupados a todos los procesos
+            while not agotado and len(cola) < 2 * workers:
+                tarea = next(tareas, None)
+                if tarea is None:
+                    agotado = True
+                elif tarea[1] is not None:
+                    yield (tarea[0], *tarea[1], None)
+                else:
+                    cola.append(tarea[0])
+            while cola and (libres or len(procesos) < workers):
+                conexion = libres.pop() if libres else arrancar()
+                ruta = cola.pop(0)
+                conexion.send(ruta)
+                en_curso[conexion] = (ruta, time.monotonic())
+            if not en_curso:
+                if agotado and not cola:
+                    break
+                continue
+
+            for conexion in wait(list(en_curso), timeout=0.5):
+                ruta, inicio = en_curso.pop(conexion)
+                try:
+                    texto, ubicaciones, estado, medida = conexion.recv()
+                except (EOFError, OSError):
+                    # El proceso ha muerto a mitad de extracción
+                    descartar(conexion)
+                    yield ruta, '', [], ESTADO_ERROR, {'segundos': time.monotonic() - inicio,
+                                                       'error': 'ProcesoTerminado'}
+                    continue
+                libres.append(conexion)
+                yield ruta, texto, ubicaciones, estado, medida
+
+            ahora = time.monotonic()
+            for conexion, (ruta, inicio) in list(en_curso.items()):
+                if limite_segundos and ahora - inicio > limite_segundos:
+                    estado, error = ESTADO_TIEMPO, 'Timeout'
+                elif limite_memoria_mb and memoria_proceso_mb(procesos[conexion].pid) > limite_memoria_mb:
+                    estado, error = ESTADO_MEMORIA, 'MemoryError'
+                else:
+                    continue
+                del en_curso[conexion]
+                descartar(conexion)
+                yield ruta, '', [], estado, {'segundos': ahora - inicio, 'error': error}
+    finally:
+        for conexion in list(procesos):
+            if conexion in libres:
+                try:
+                    conexion.send(None)
+                except OSError:
+                    pass
+            descartar(conexion)
+
+def extraer_textos(archivos, cache, workers=None, limite_segundos=0, limite_memoria_mb=0,
+                   reintentar_omitidos=False, telemetria=None):
+    # Devuelve (ruta, texto, ubicaciones, estado) en orden de finalización: lo que
+    # ya está en caché sale de inmediato y el resto según terminan los procesos.
+    # Los archivos idénticos (mismo tamaño y misma huella) se extraen una sola vez.
+    # Si se pasa un objeto Telemetria, se registra una medida por archivo. Lo
+    # que no se pudo extraer por falta de una dependencia no se guarda en caché.
+    # Cada escritura en la caché se confirma antes de seguir: ninguna
+    # transacción queda abierta mientras se espera a los procesos, así quien
+    # busca a la vez (o el indexador en segundo plano) no encuentra la base bloqueada.
+    firmas = {}
+    huellas = {}
+    en_vuelo = {}
+    esperando = {}
+
+    def huella(arch):
+        if arch not in huellas:
+            huellas[arch] = huella_archivo(arch)
+        return huellas[arch]
+
+    def buscar_identico(arch):
+        # Documento de un archivo idéntico ya extraído, False si hay uno idéntico
+        # extrayéndose ahora mismo (se reutilizará al terminar) o None si no hay
+        tamano = firmas[arch][0]
+        if not extension_soportada(arch):
+            return None
+        # Solo se calcula la huella si algún otro archivo tiene el mismo tamaño
+        if not en_vuelo.get(tamano) and not hay_mismo_tamano(cache, arch, tamano):
+            return None
+        try:
+            documento = buscar_copia(cache, arch, tamano, huella(arch), VERSION_EXTRACTOR)
+            if documento is not None:
+                return documento
+            # Como en buscar_copia, solo cuentan los de la misma extensión: el
+            # mismo contenido puede extraerse distinto (.html frente a .txt)
+            extension = os.path.splitext(arch)[1].lower()
+            for otro in en_vuelo.get(tamano, ()):
+                if os.path.splitext(otro)[1].lower() == extension and huella(otro) == huella(arch):
+                    esperando.setdefault(otro, []).append(arch)
+                    return False
+        except OSError:
+            pass
+        return None
+
+    def confirmar():
+        if cache.in_transaction:
+            cache.commit()
+
+    def medir(arch, origen, estado, texto='', tamano=0, medida=None):
+        if telemetria is not None:
+            medida = medida or {}
+            telemetria.registrar(arch, origen, estado, medida.get('error'), medida.get('segundos', 0),
+                                 tamano, len(texto))
+
+    def tareas():
+        for arch in archivos:
+            try:
+                firmas[arch] = firma_archivo(arch)
+            except OSError as e:
+                medir(arch, ORIGEN_EXTRAIDO, ESTADO_ERROR, medida={'error': type(e).__name__})
+                yield arch, ('', [], ESTADO_ERROR)
+                continue
+            documento = leer_cache(cache, arch, *firmas[arch], VERSION_EXTRACTOR)
+            if documento is not None and (documento[2] == ESTADO_OK or not reintentar_omitidos):
+                medir(arch, ORIGEN_CACHE, documento[2], documento[0], firmas.pop(arch)[0])
+                yield arch, documento
+                continue
+            documento = buscar_identico(arch)
+            # buscar_copia puede haber guardado huellas de otros archivos
+            confirmar()
+            if documento is False:
+                continue
+            if documento is not None:
+                medir(arch, ORIGEN_COPIA, documento[2], documento[0], firmas[arch][0])
+                guardar_cache(cache, arch, *firmas.pop(arch), VERSION_EXTRACTOR, *documento,
+                              huella=huellas.get(arch))
+                confirmar()
+                yield arch, documento
+                continue
+            en_vuelo.setdefault(firmas[arch][0], []).append(arch)
+            yield arch, None
+
+    for arch, texto, ubicaciones, estado, medida in extraer_en_procesos(tareas(), workers, limite_segundos,
+                                                                        limite_memoria_mb):
+        if arch in firmas:
+            tamano, mtime_ns = firmas.pop(arch)
+            medir(arch, ORIGEN_EXTRAIDO, estado, texto, tamano, medida)
+            en_vuelo[tamano].remove(arch)
+            if estado != ESTADO_NO_DISPONIBLE:
+                guardar_cache(cache, arch, tamano, mtime_ns, VERSION_EXTRACTOR, texto, ubicaciones, estado,
+                              huellas.get(arch))
+                confirmar()
+        yield arch, texto, ubicaciones, estado
+        for copia in esperando.pop(arch, ()):
+            firma = firmas.pop(copia)
+            medir(copia, ORIGEN_COPIA, estado, texto, firma[0])
+            if estado != ESTADO_NO_DISPONIBLE:
+                guardar_cache(cache, copia, *firma, VERSION_EXTRACTOR, texto, ubicaciones, estado,
+                              huellas.get(copia))
+                confirmar()
+            yield copia, texto, ubicaciones, estado
+
+cargar_plugins()
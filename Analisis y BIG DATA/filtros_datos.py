@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+
+# Motor de filtros del analizador: prepara cada columna una sola vez (códigos
+# de los valores como texto o valores numéricos ordenados) y guarda una máscara
+# booleana por filtro. En cada recarga solo se recalcula la máscara del filtro
+# que ha cambiado y se combinan todas con un AND vectorizado. Las estadísticas
+# de cada columna (valores distintos, más frecuentes, mínimo y máximo) también
+# se calculan una sola vez y deciden qué control de filtro se muestra.
+
+# Más frecuentes que se guardan por columna
+TOP_K = 50
+# Agregados por grupo que se guardan antes de vaciar la caché
+AGREGADOS_MAX = 32
+
+
+class MotorFiltros:
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.columnas = {}
+        self.mascaras = {}
+        self.resumenes = {}
+        # Máscara de la última selección (None: todas las filas) y su clave
+        self.seleccion = None
+        self.estado = ()
+        self.agregados = {}
+
+    def preparar(self, col):
+        # ('texto', códigos, textos) o ('numero' | 'fecha', orden, valores ordenados
+        # sin NaN); las fechas se ordenan como nanosegundos
+        if col not in self.columnas:
+            serie = self.df[col]
+            if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+                fechas = pd.DatetimeIndex(serie)
+                if fechas.tz is not None:
+                    fechas = fechas.tz_convert(None)
+                valores = fechas.as_unit('ns').asi8.astype(np.float64)
+                valores[fechas.isna()] = np.nan
+                orden = np.argsort(valores, kind='stable')
+                validos = int(np.count_nonzero(~np.isnan(valores)))
+                self.columnas[col] = ('fecha', orden[:validos], valores[orden[:validos]])
+            elif pd.api.types.is_numeric_dtype(serie.dtype) and not pd.api.types.is_bool_dtype(serie.dtype):
+                valores = serie.to_numpy(dtype=np.float64, na_value=np.nan)
+                orden = np.argsort(valores, kind='stable')
+                validos = int(np.count_nonzero(~np.isnan(valores)))
+                # argsort deja los NaN al final
+                self.columnas[col] = ('numero', orden[:validos], valores[orden[:validos]])
+            else:
+                # Se comparan como texto, igual que se muestran; solo se convierten
+                # a texto los valores distintos
+                codigos, distintos = pd.factorize(serie)
+                codigos_texto, textos = pd.factorize(pd.Index(distintos).astype(str))
+                codigos = np.where(codigos >= 0, codigos_texto[codigos], -1) if len(distintos) else codigos
+                self.columnas[col] = ('texto', codigos, np.asarray(textos, dtype=object))
+        return self.columnas[col]
+
+    def opciones(self, col):
+        return sorted(self.preparar(col)[2])
+
+    def rango(self, col):
+        # (mínimo, máximo) de una columna numérica o de fechas, o None si está vacía
+        tipo, _, ordenados = self.preparar(col)
+        if not len(ordenados):
+            return None
+        if tipo == 'fecha':
+            return tuple(pd.Timestamp(int(v)).to_pydatetime() for v in (ordenados[0], ordenados[-1]))
+        return ordenados[0], ordenados[-1]
+
+    def resumen(self, col):
+        # {'distintos', 'frecuentes': [(valor, filas)], 'minimo', 'maximo'}
+        if col not in self.resumenes:
+            tipo, indices, valores = self.preparar(col)
+            if tipo == 'texto':
+                cuentas = np.bincount(indices[indices >= 0], minlength=len(valores))
+                mas = np.argsort(-cuentas, kind='stable')[:TOP_K]
+                self.resumenes[col] = {'distintos': len(valores),
+                                       'frecuentes': [(valores[i], int(cuentas[i])) for i in mas],
+                                       'minimo': None, 'maximo': None}
+            else:
+                minimo, maximo = self.rango(col) or (None, None)
+                self.resumenes[col] = {'distintos': len(np.unique(valores)), 'frecuentes': [],
+                                       'minimo': minimo, 'maximo': maximo}
+        return self.resumenes[col]
+
+    def mascara(self, col, valor):
+        # valor: lista de textos seleccionados, texto a buscar dentro de los
+        # valores (sin distinguir mayúsculas) o (mínimo, máximo)
+        if isinstance(valor, str):
+            clave = ('contiene', valor)
+        else:
+            clave = tuple(sorted(valor)) if isinstance(valor, list) else tuple(valor)
+        guardada = self.mascaras.get(col)
+        if guardada is not None and guardada[0] == clave:
+            return guardada[1]
+        tipo, indices, valores = self.preparar(col)
+        if tipo == 'texto' and isinstance(valor, str):
+            tabla = np.zeros(len(valores) + 1, dtype=bool)
+            tabla[:-1] = pd.Series(valores, dtype=object).str.contains(valor, case=False, regex=False)
+            mascara = tabla[indices]
+        elif tipo == 'texto':
+            # Tabla de consulta por código; el último hueco (código -1) es el de los vacíos
+            seleccion = set(clave)
+            tabla = np.zeros(len(valores) + 1, dtype=bool)
+            tabla[:-1] = [v in seleccion for v in valores]
+            mascara = tabla[indices]
+        else:
+            limites = clave
+            if tipo == 'fecha':
+                limites = [float(pd.Timestamp(v).as_unit('ns').value) for v in clave]
+            desde = np.searchsorted(valores, limites[0], side='left')
+            hasta = np.searchsorted(valores, limites[1], side='right')
+            mascara = np.zeros(len(self.df), dtype=bool)
+            mascara[indices[desde:hasta]] = True
+        self.mascaras[col] = (clave, mascara)
+        return mascara
+
+    def filtrar(self, filtros):
+        # Sin filtros se devuelve la propia tabla, sin copiarla
+        for col in list(self.mascaras):
+            if col not in filtros:
+                del self.mascaras[col]
+        if not filtros:
+            self.seleccion, self.estado = None, ()
+            return self.df
+        mascara = np.logical_and.reduce([self.mascara(col, valor) for col, valor in filtros.items()])
+        self.seleccion = mascara
+        self.estado = tuple(sorted((col, self.mascaras[col][0]) for col in filtros))
+        return self.df[mascara]
+
+    def suma_por_grupo(self, col, col_valor):
+        # Suma de col_valor por valor de la columna de texto col en la última
+        # selección, de mayor a menor, como groupby(col).sum(). Usa los códigos
+        # ya preparados (bincount) y se guarda por estado de los filtros.
+        clave = (col, col_valor, self.estado)
+        if clave not in self.agregados:
+            if len(self.agregados) >= AGREGADOS_MAX:
+                self.agregados.clear()
+            _, codigos, textos = self.preparar(col)
+            valores = self.df[col_valor].to_numpy(dtype=np.float64, na_value=np.nan)
+            if self.seleccion is not None:
+                codigos, valores = codigos[self.seleccion], valores[self.seleccion]
+            con_grupo = codigos >= 0
+            presentes = np.bincount(codigos[con_grupo], minlength=len(textos)) > 0
+            sumables = con_grupo & ~np.isnan(valores)
+            sumas = np.bincount(codigos[sumables], weights=valores[sumables], minlength=len(textos))
+            self.agregados[clave] = pd.Series(sumas[presentes], index=pd.Index(textos[presentes], name=col),
+                                              name=col_valor).sort_values(ascending=False)
+        return self.agregados[clave]
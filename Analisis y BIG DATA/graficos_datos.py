@@ -0,0 +1,46 @@
+import numpy as np
+from matplotlib import colormaps
+from matplotlib.patches import Patch
+
+# Gráficos del analizador para tablas grandes: por encima de UMBRAL_PUNTOS la
+# dispersión se dibuja como imagen de densidad (histograma 2D calculado con un
+# solo bincount) en vez de un marcador por fila, y las barras muestran los
+# TOP_N_BARRAS grupos mayores más una barra que acumula el resto.
+
+UMBRAL_PUNTOS = 20_000
+TOP_N_BARRAS = 20
+CELDAS_DENSIDAD = 200
+
+
+def barras_top(serie, n=TOP_N_BARRAS, etiqueta='Otros'):
+    # serie ordenada de mayor a menor; lo que pasa de n se suma en una sola barra
+    if len(serie) <= n + 1:
+        return serie
+    resto = serie.iloc[n:]
+    barras = serie.iloc[:n].copy()
+    barras[f'{etiqueta} ({len(resto)})'] = resto.sum()
+    return barras
+
+
+def densidad_por_grupo(x, y, grupos, k, celdas=CELDAS_DENSIDAD):
+    # Histograma 2D de los puntos y, por celda, el grupo (0..k-1) con más puntos.
+    # Devuelve {'cuentas', 'dominante', 'extension'}; las filas son el eje y.
+    x0, x1, y0, y1 = x.min(), x.max(), y.min(), y.max()
+    ancho, alto = (x1 - x0) or 1.0, (y1 - y0) or 1.0
+    ix = np.clip(((x - x0) / ancho * celdas).astype(np.int64), 0, celdas - 1)
+    iy = np.clip(((y - y0) / alto * celdas).astype(np.int64), 0, celdas - 1)
+    por_grupo = np.bincount((iy * celdas + ix) * k + grupos,
+                            minlength=celdas * celdas * k).reshape(celdas, celdas, k)
+    return {'cuentas': por_grupo.sum(axis=2), 'dominante': por_grupo.argmax(axis=2),
+            'extension': (x0, x0 + ancho, y0, y0 + alto)}
+
+
+def dibujar_densidad(ax, densidad, k, cmap='viridis'):
+    # Color del grupo dominante en cada celda y opacidad según el logaritmo
+    # de los puntos que contiene; las celdas vacías quedan transparentes
+    mapa = colormaps[cmap]
+    cuentas = densidad['cuentas']
+    imagen = mapa(densidad['dominante'] / max(1, k - 1))
+    imagen[..., 3] = np.log1p(cuentas) / np.log1p(max(1, cuentas.max()))
+    ax.imshow(imagen, origin='lower', extent=densidad['extension'], aspect='auto', interpolation='nearest')
+    ax.legend(handles=[Patch(color=mapa(g / max(1, k - 1)), label=str(g)) for g in range(k)], title="Clusters")
@@ -0,0 +1,471 @@
+import os
+import io
+import datetime
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# Ingesta del analizador: cada archivo subido se identifica por la huella de su
+# contenido, de modo que leerlo y limpiarlo solo se hace una vez. Las tablas ya
+# limpias se guardan en memoria (LRU con tope de tamaño) y, si hay pyarrow, en
+# una caché Parquet en disco que sobrevive entre sesiones.
+CARPETA_CACHE = os.environ.get(
+    'ANALIZADOR_CACHE',
+    os.path.join(os.path.expanduser('~'), '.analizador_datos')
+)
+MEMORIA_MAX = 512 * 1024 * 1024
+TAMANO_MAX_DISCO = 2 * 1024 * 1024 * 1024
+
+# Incrementar si cambia limpiar_y_maquetar o compactar para no reutilizar tablas antiguas
+VERSION_LIMPIEZA = 3
+
+# Lectura por trozos de CSV/TSV y umbrales para compactar tipos
+FILAS_TROZO = 100_000
+PROPORCION_CATEGORIA = 0.5
+# Textos que se aceptan como número o como fecha al compactar. Un número con
+# ceros a la izquierda ('007', códigos postales) sigue siendo texto, y una
+# fecha necesita día, mes y año ('1-2' es una referencia, no el 2 de enero).
+PATRON_NUMERO = r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?'
+PATRON_FECHA = (r'(?:\d{4}[-/.]\d{1,2}[-/.]\d{1,2}|\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4})'
+                r'(?:[ T]\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?')
+
+# Varios archivos: extensiones que se leen de una carpeta y columna que indica
+# de qué archivo sale cada fila
+EXTENSIONES = ('xlsx', 'xls', 'csv', 'tsv')
+COLUMNA_ORIGEN = 'Archivo origen'
+
+
+def limpiar_y_maquetar(df: pd.DataFrame) -> pd.DataFrame:
+    # Se calculan máscaras de filas y columnas y se selecciona una sola vez,
+    # en vez de copiar la tabla en cada paso
+    no_vacias = df.notna().any(axis=1).to_numpy().copy()
+
+    # Detectar encabezado correcto si las columnas tienen muchos 'Unnamed'
+    encabezado = None
+    if df.columns.astype(str).str.contains('Unnamed').sum() > len(df.columns) // 2:
+        for posicion in np.flatnonzero(no_vacias)[:3]:  # revisar primeras 3 filas
+            if df.iloc[posicion].notna().sum() > len(df.columns) / 2:
+                # El encabezado y lo que haya por encima dejan de ser datos
+                encabezado = df.iloc[posicion]
+                no_vacias[:posicion + 1] = False
+                break
+
+    columnas = pd.Index(encabezado.astype(object) if encabezado is not None else df.columns).rename(None)
+    # Quitar columnas con nombre Unnamed o vacío
+    utiles = ~columnas.astype(str).str.contains('^Unnamed')
+    df = df.iloc[no_vacias, utiles]
+    df.columns = columnas[utiles]
+
+    # Resetear índice
+    df.reset_index(drop=True, inplace=True)
+
+    # Opcional: rellenar NaNs en columnas clave si quieres
+    # df['Proyecto'] = df['Proyecto'].fillna('No especificado')
+
+    if encabezado is not None:
+        # Con el encabezado dentro de los datos, las columnas se leyeron como texto
+        df = compactar(df)
+    return df
+
+
+def es_texto(serie):
+    return serie.dtype == object or pd.api.types.is_string_dtype(serie.dtype)
+
+
+def a_categoria(serie):
+    # Categorías siempre de tipo object para poder unir trozos distintos
+    categorica = pd.Categorical(serie.astype(object))
+    return categorica.set_categories(categorica.categories.astype(object))
+
+
+def reducir_numero(serie):
+    # Enteros al tipo más pequeño que los contiene; decimales a float32 solo
+    # si no se pierde precisión (importes)
+    if pd.api.types.is_integer_dtype(serie.dtype):
+        return pd.to_numeric(serie, downcast='integer')
+    if pd.api.types.is_float_dtype(serie.dtype) and serie.dtype != np.float32:
+        reducida = serie.astype(np.float32)
+        if np.array_equal(reducida.to_numpy(np.float64), serie.to_numpy(np.float64), equal_nan=True):
+            return reducida
+    return serie
+
+
+def cumplen_patron(valores, patron, otros):
+    # Los textos deben seguir el patrón completo; el resto, ser del tipo 'otros'
+    textos = valores.map(lambda v: isinstance(v, str))
+    return bool(valores[textos].astype(str).str.fullmatch(patron).all() and
+                valores[~textos].map(lambda v: isinstance(v, otros)).all())
+
+
+def convertir_texto(serie):
+    # Una columna de texto se convierte en números o fechas si todos sus valores
+    # lo permiten; si no, en categoría cuando se repite lo suficiente. Solo se
+    # analizan los valores distintos, no cada fila.
+    categorica = serie if isinstance(serie.dtype, pd.CategoricalDtype) else serie.astype('category')
+    valores = pd.Series(categorica.cat.categories.astype(object))
+    codigos = categorica.cat.codes.to_numpy()
+    if len(valores):
+        numeros = pd.to_numeric(valores, errors='coerce')
+        if numeros.notna().all() and cumplen_patron(valores, PATRON_NUMERO, (int, float, np.number)):
+            resultado = numeros.to_numpy(np.float64)[codigos]
+            resultado[codigos < 0] = np.nan
+            if (codigos >= 0).all() and np.array_equal(resultado, np.floor(resultado)):
+                resultado = resultado.astype(np.int64)
+            return reducir_numero(pd.Series(resultado, index=serie.index, name=serie.name))
+        if cumplen_patron(valores, PATRON_FECHA, (datetime.date, np.datetime64)):
+            fechas = pd.to_datetime(pd.Index(valores), errors='coerce', format='mixed')
+            if fechas.notna().all():
+                # Código -1 = vacío
+                return pd.Series(fechas.take(codigos, allow_fill=True, fill_value=pd.NaT),
+                                 index=serie.index, name=serie.name)
+    if len(valores) <= PROPORCION_CATEGORIA * max(1, len(serie)):
+        return categorica
+    return serie if es_texto(serie) else categorica.astype(object)
+
+
+def compactar(df):
+    for col in df.columns:
+        serie = df[col]
+        if es_texto(serie) or isinstance(serie.dtype, pd.CategoricalDtype):
+            df[col] = convertir_texto(serie)
+        else:
+            df[col] = reducir_numero(serie)
+    return df
+
+
+def memoria(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def leer_csv_por_trozos(origen, sep=',', filas_trozo=FILAS_TROZO):
+    # Lee por trozos; el texto de cada trozo se guarda como categoría (cada valor
+    # distinto una sola vez) y al final se unen las categorías de todos. Devuelve
+    # (tabla, bytes que ocupaba leída tal cual).
+    trozos = []
+    bytes_sin_compactar = 0
+    for trozo in pd.read_csv(origen, sep=sep, chunksize=filas_trozo):
+        bytes_sin_compactar += memoria(trozo)
+        for col in trozo.columns:
+            if es_texto(trozo[col]):
+                trozo[col] = a_categoria(trozo[col])
+        trozos.append(trozo)
+    if not trozos:
+        return pd.DataFrame(), 0
+    # Una columna es texto si lo es en algún trozo
+    texto = [col for col in trozos[0].columns
+             if any(isinstance(t[col].dtype, pd.CategoricalDtype) for t in trozos)]
+    columnas = {}
+    for col in trozos[0].columns:
+        if col in texto:
+            columnas[col] = pd.Series(
+                union_categoricals([t[col].array if isinstance(t[col].dtype, pd.CategoricalDtype)
+                                    else a_categoria(t[col]) for t in trozos])
+            )
+        else:
+            columnas[col] = pd.concat([t[col] for t in trozos], ignore_index=True)
+        for t in trozos:
+            del t[col]
+    return pd.DataFrame(columnas), bytes_sin_compactar
+
+
+def huella_datos(datos: bytes) -> str:
+    return hashlib.blake2b(datos, digest_size=16).hexdigest()
+
+
+def leer_tabla(datos: bytes, nombre: str) -> pd.DataFrame:
+    # Tabla con tipos compactos; en df.attrs['memoria'] quedan los bytes que
+    # ocuparía leída tal cual y los que ocupa. ValueError si la extensión no
+    # está soportada.
+    tipo = nombre.rsplit('.', 1)[-1].lower()
+    if tipo in ['xlsx', 'xls']:
+        df = pd.read_excel(io.BytesIO(datos))
+        antes = memoria(df)
+    elif tipo == 'csv':
+        df, antes = leer_csv_por_trozos(io.BytesIO(datos))
+    elif tipo == 'tsv':
+        df, antes = leer_csv_por_trozos(io.BytesIO(datos), sep='\t')
+    else:
+        raise ValueError(f"Formato no soportado: {tipo}")
+    df = compactar(df)
+    df.attrs['memoria'] = {'antes': antes, 'despues': memoria(df)}
+    return df
+
+
+class CacheTablas:
+    # LRU en memoria limitada por el tamaño real de las tablas; compartida entre
+    # sesiones, de ahí el cerrojo
+
+    def __init__(self, bytes_max=MEMORIA_MAX):
+        self.bytes_max = bytes_max
+        self.tablas = OrderedDict()
+        self.ocupado = 0
+        self.cerrojo = threading.Lock()
+
+    def obtener(self, clave):
+        with self.cerrojo:
+            entrada = self.tablas.get(clave)
+            if entrada is None:
+                return None
+            self.tablas.move_to_end(clave)
+            return entrada[0]
+
+    def guardar(self, clave, df):
+        tamano = memoria(df)
+        with self.cerrojo:
+            if clave in self.tablas:
+                self.ocupado -= self.tablas.pop(clave)[1]
+            self.tablas[clave] = (df, tamano)
+            self.ocupado += tamano
+            # La más reciente se conserva aunque por sí sola supere el tope
+            while self.ocupado > self.bytes_max and len(self.tablas) > 1:
+                _, (_, liberado) = self.tablas.popitem(last=False)
+                self.ocupado -= liberado
+
+
+def ruta_parquet(clave, carpeta=CARPETA_CACHE):
+    return os.path.join(carpeta, clave + '.parquet')
+
+
+def leer_parquet(clave, carpeta=CARPETA_CACHE):
+    if pyarrow is None:
+        return None
+    ruta = ruta_parquet(clave, carpeta)
+    try:
+        df = pd.read_parquet(ruta)
+        os.utime(ruta)
+        return df
+    except (OSError, ValueError, pyarrow.ArrowException):
+        return None
+
+
+def guardar_parquet(clave, df, carpeta=CARPETA_CACHE, tamano_max=TAMANO_MAX_DISCO):
+    # No todas las tablas caben en Parquet (nombres de columna no textuales,
+    # columnas con tipos mezclados); esas se quedan solo en memoria
+    if pyarrow is None or not all(isinstance(c, str) for c in df.columns):
+        return False
+    ruta = ruta_parquet(clave, carpeta)
+    temporal = ruta + '.tmp'
+    try:
+        os.makedirs(carpeta, exist_ok=True)
+        df.to_parquet(temporal, index=False)
+        os.replace(temporal, ruta)
+    except (OSError, ValueError, TypeError, pyarrow.ArrowException):
+        try:
+            os.remove(temporal)
+        except OSError:
+            pass
+        return False
+    recortar_cache(carpeta, tamano_max)
+    return True
+
+
+def recortar_cache(carpeta=CARPETA_CACHE, tamano_max=TAMANO_MAX_DISCO):
+    # LRU: borra las tablas con acceso más antiguo hasta bajar del límite
+    try:
+        entradas = [(e.path, e.stat()) for e in os.scandir(carpeta) if e.is_file()]
+    except OSError:
+        return
+    total = sum(info.st_size for _, info in entradas)
+    if total <= tamano_max:
+        return
+    for nombre, info in sorted(entradas, key=lambda entrada: entrada[1].st_mtime):
+        try:
+            os.remove(nombre)
+        except OSError:
+            continue
+        total -= info.st_size
+        if total <= tamano_max:
+            break
+
+
+def clave_tabla(huella, nombre):
+    return f'{huella}-{nombre.rsplit(".", 1)[-1].lower()}-{VERSION_LIMPIEZA}'
+
+
+def leer_datos(origen):
+    # Contenido de un archivo dado como bytes, como ruta o como función que
+    # devuelve los bytes
+    if isinstance(origen, (bytes, bytearray)):
+        return origen
+    if isinstance(origen, (str, os.PathLike)):
+        return leer_archivo(origen)
+    return origen()
+
+
+def preparar_tabla(origen, nombre: str) -> pd.DataFrame:
+    # Lectura y limpieza de un archivo; se ejecuta también en los procesos de
+    # cargar_varios, de ahí que sea una función de módulo y que lea ella misma
+    # el archivo cuando recibe su ruta
+    df = leer_tabla(leer_datos(origen), nombre)
+    medida = df.attrs.get('memoria')
+    df = limpiar_y_maquetar(df)
+    if medida:
+        df.attrs['memoria'] = {**medida, 'despues': memoria(df)}
+    return df
+
+
+def buscar_en_cache(clave, cache, persistir=True):
+    # (tabla, 'memoria' | 'disco') o (None, None)
+    df = cache.obtener(clave)
+    if df is not None:
+        return df, 'memoria'
+    df = leer_parquet(clave) if persistir else None
+    if df is not None:
+        cache.guardar(clave, df)
+        return df, 'disco'
+    return None, None
+
+
+def guardar_en_cache(clave, df, cache, persistir=True):
+    if persistir:
+        guardar_parquet(clave, df)
+    cache.guardar(clave, df)
+
+
+def cargar_datos(datos, nombre: str, cache: CacheTablas, persistir=True, huella=None):
+    # datos: bytes, ruta o función que devuelve los bytes; con la huella ya
+    # calculada, el archivo solo se lee si no está en caché. Devuelve (tabla
+    # limpia, origen) con origen 'memoria', 'disco' o 'archivo'. La tabla es una
+    # copia superficial: modificar columnas no altera la caché.
+    clave = clave_tabla(huella or huella_datos(leer_datos(datos)), nombre)
+    df, origen = buscar_en_cache(clave, cache, persistir)
+    if df is None:
+        df = preparar_tabla(datos, nombre)
+        origen = 'archivo'
+        guardar_en_cache(clave, df, cache, persistir)
+    return df.copy(deep=False), origen
+
+
+def archivos_carpeta(carpeta):
+    # Rutas de las tablas de la carpeta y sus subcarpetas, en orden; OSError si
+    # la carpeta no existe
+    if not os.path.isdir(carpeta):
+        raise NotADirectoryError(carpeta)
+    rutas = []
+    for raiz, subcarpetas, archivos in os.walk(carpeta):
+        subcarpetas.sort()
+        rutas += [os.path.join(raiz, a) for a in sorted(archivos)
+                  if a.rsplit('.', 1)[-1].lower() in EXTENSIONES and not a.startswith('~$')]
+    return rutas
+
+
+def leer_archivo(ruta):
+    with open(ruta, 'rb') as f:
+        return f.read()
+
+
+def unir_tablas(tablas):
+    # tablas: {nombre: tabla}. Une columnas por nombre (las que faltan en un
+    # archivo quedan vacías), construye cada columna de una sola vez y añade
+    # COLUMNA_ORIGEN. El texto se une como categoría y se vuelve a compactar,
+    # por si un archivo lo trae como número o fecha y otro como texto.
+    nombres = list(tablas)
+    filas = [len(tablas[n]) for n in nombres]
+    orden = list(dict.fromkeys(c for n in nombres for c in tablas[n].columns if c != COLUMNA_ORIGEN))
+    columnas = {}
+    for col in orden:
+        partes = [tablas[n][col] if col in tablas[n].columns else None for n in nombres]
+        presentes = [p for p in partes if p is not None]
+        if any(es_texto(p) or isinstance(p.dtype, pd.CategoricalDtype) for p in presentes) or \
+                len({pd.api.types.is_datetime64_any_dtype(p.dtype) for p in presentes}) > 1:
+            # Lo que no es texto se pasa a texto para que 5 y '5' sean el mismo valor
+            categoricas = [a_categoria(pd.Series([None] * n, dtype=object) if p is None else
+                                       p if es_texto(p) or isinstance(p.dtype, pd.CategoricalDtype) else
+                                       p.astype(str).where(p.notna()))
+                           for p, n in zip(partes, filas)]
+            columnas[col] = convertir_texto(pd.Series(union_categoricals(categoricas)))
+        else:
+            vacia = pd.NaT if pd.api.types.is_datetime64_any_dtype(presentes[0].dtype) else np.nan
+            columnas[col] = reducir_numero(pd.concat(
+                [p.reset_index(drop=True) if p is not None else pd.Series([vacia] * n)
+                 for p, n in zip(partes, filas)],
+                ignore_index=True
+            ))
+        for n in nombres:
+            if col in tablas[n].columns:
+                del tablas[n][col]
+    columnas[COLUMNA_ORIGEN] = pd.Categorical.from_codes(np.repeat(np.arange(len(nombres)), filas),
+                                                         categories=pd.Index(nombres, dtype=object))
+    return pd.DataFrame(columnas)
+
+
+def sin_tablas(errores):
+    return ValueError("Ningún archivo se pudo leer: " + "; ".join(f"{n}: {e}" for n, e in errores.items()))
+
+
+def cargar_varios(archivos, cache: CacheTablas, persistir=True, workers=None):
+    # archivos: [(nombre, datos, huella)] con datos como en cargar_datos. Los que
+    # no están en caché se leen y limpian en paralelo en procesos: las rutas se
+    # leen dentro de cada proceso y las funciones se llaman aquí, porque pueden
+    # no poder enviarse a otro proceso. La unión se hace una sola vez al final y
+    # se guarda en memoria junto con los archivos que fallaron (en attrs), para
+    # no volver a intentarlos mientras no cambien. Devuelve (tabla unida,
+    # {nombre: origen}, {nombre: error}).
+    huellas = '\n'.join(f'{nombre}:{huella}' for nombre, _, huella in archivos)
+    clave_union = f'{huella_datos(huellas.encode())}-union-{VERSION_LIMPIEZA}'
+    df = cache.obtener(clave_union)
+    if df is not None:
+        errores = dict(df.attrs.get('errores', {}))
+        if len(errores) == len(archivos):
+            raise sin_tablas(errores)
+        return (df.copy(deep=False), {nombre: 'memoria' for nombre, _, _ in archivos if nombre not in errores},
+                errores)
+
+    tablas, origenes, errores, pendientes = {}, {}, {}, {}
+    for nombre, datos, huella in archivos:
+        clave = clave_tabla(huella, nombre)
+        tablas[nombre], origenes[nombre] = buscar_en_cache(clave, cache, persistir)
+        if tablas[nombre] is None:
+            pendientes[nombre] = (clave, datos)
+
+    def terminar(nombre, df):
+        guardar_en_cache(pendientes[nombre][0], df, cache, persistir)
+        tablas[nombre], origenes[nombre] = df, 'archivo'
+
+    def fallo(nombre, error):
+        del tablas[nombre], origenes[nombre]
+        errores[nombre] = str(error) or type(error).__name__
+
+    workers = min(len(pendientes), workers or os.cpu_count() or 1)
+    if workers <= 1:
+        for nombre, (_, datos) in pendientes.items():
+            try:
+                terminar(nombre, preparar_tabla(datos, nombre))
+            except Exception as e:
+                fallo(nombre, e)
+    elif pendientes:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context()) as procesos:
+            futuros = {procesos.submit(preparar_tabla, datos if isinstance(datos, (bytes, str, os.PathLike))
+                                       else leer_datos(datos), nombre): nombre
+                       for nombre, (_, datos) in pendientes.items()}
+            for futuro in as_completed(futuros):
+                try:
+                    terminar(futuros[futuro], futuro.result())
+                except Exception as e:
+                    fallo(futuros[futuro], e)
+
+    if not tablas:
+        vacia = pd.DataFrame()
+        vacia.attrs['errores'] = errores
+        cache.guardar(clave_union, vacia)
+        raise sin_tablas(errores)
+    # Se unen copias superficiales: borrar columnas ya unidas no toca la caché
+    medidas = [t.attrs.get('memoria') for t in tablas.values()]
+    df = unir_tablas({nombre: t.copy(deep=False) for nombre, t in tablas.items()})
+    if all(medidas):
+        df.attrs['memoria'] = {'antes': sum(m['antes'] for m in medidas), 'despues': memoria(df)}
+    if errores:
+        df.attrs['errores'] = errores
+    cache.guardar(clave_union, df)
+    return df.copy(deep=False), origenes, errores
@@ -0,0 +1,65 @@
+import os
+import hashlib
+
+# Caché en disco de miniaturas para la vista de resultados. Se limita por
+# tamaño total y se eliminan primero las usadas hace más tiempo (cada uso
+# actualiza la fecha de modificación de la miniatura).
+CARPETA_MINIATURAS = os.environ.get(
+    'BUSCADOR_MINIATURAS',
+    os.path.join(os.path.expanduser('~'), '.buscador_miniaturas')
+)
+TAMANO_MAX_CACHE = 200 * 1024 * 1024
+LADO_MINIATURA = 320
+
+
+def ruta_miniatura(path, carpeta=CARPETA_MINIATURAS):
+    # La clave incluye tamaño y fecha para que un archivo modificado genere otra
+    info = os.stat(path)
+    clave = f'{os.path.abspath(path)}|{info.st_size}|{info.st_mtime_ns}|{LADO_MINIATURA}'
+    return os.path.join(carpeta, hashlib.blake2b(clave.encode('utf8'), digest_size=16).hexdigest() + '.jpg')
+
+
+def obtener_miniatura(path, carpeta=CARPETA_MINIATURAS, tamano_max=TAMANO_MAX_CACHE):
+    # Devuelve la ruta de la miniatura, creándola si hace falta, o None si la
+    # imagen no se puede abrir
+    from PIL import Image
+    try:
+        destino = ruta_miniatura(path, carpeta)
+        if os.path.exists(destino):
+            os.utime(destino)
+            return destino
+        os.makedirs(carpeta, exist_ok=True)
+        with Image.open(path) as img:
+            # draft deja que el decodificador JPEG reduzca al leer, sin cargar la imagen completa
+            img.draft('RGB', (LADO_MINIATURA, LADO_MINIATURA))
+            img = img.convert('RGB')
+            img.thumbnail((LADO_MINIATURA, LADO_MINIATURA))
+            img.save(destino, 'JPEG', quality=80)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    recortar_cache(carpeta, tamano_max)
+    return destino
+
+
+def recortar_cache(carpeta=CARPETA_MINIATURAS, tamano_max=TAMANO_MAX_CACHE):
+    # LRU: borra las miniaturas con acceso más antiguo hasta bajar del límite
+    try:
+        entradas = [(e.path, e.stat()) for e in os.scandir(carpeta) if e.is_file()]
+    except OSError:
+        return
+    total = sum(info.st_size for _, info in entradas)
+    if total <= tamano_max:
+        return
+    for nombre, info in sorted(entradas, key=lambda entrada: entrada[1].st_mtime):
+        try:
+            os.remove(nombre)
+        except OSError:
+            continue
+        total -= info.st_size
+        if total <= tamano_max:
+            break
+
+
+def leer_archivo(path):
+    with open(path, 'rb') as f:
+        return f.read()
@@ -0,0 +1,479 @@
+import os
+import re
+import sys
+import json
+import sqlite3
+import stat
+import time
+import fnmatch
+import argparse
+import threading
+
+from cache_textos import (abrir_cache, purgar_cache, consulta_fts, buscar_indice, leer_documento,
+                          segmentos_documento, actualizar_terminos, terminos_parecidos, rutas_indexadas,
+                          olvidar_rutas,
+                          INICIO_RESALTE, FIN_RESALTE, ESTADO_OK)
+from extractores import extraer_textos, extension_soportada, is_ocr_reliable
+from telemetria import Telemetria
+from coincidencias import (BuscadorPalabras, BuscadorAproximado, dividir_segmentos, resumir_coincidencias,
+                           normalizar, distancia_edicion, aproximable, quitar_resaltes)
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+
+# Motor de búsqueda sin interfaz: lo usan la aplicación Streamlit y la línea
+# de comandos (python motor_busqueda.py search CARPETA PALABRAS --json).
+# python motor_busqueda.py watch CARPETA mantiene el índice al día en segundo plano.
+
+# Carpetas de sistema que nunca se recorren (además de las ocultas)
+CARPETAS_SISTEMA = {'$recycle.bin', 'system volume information', '__pycache__'}
+
+def es_oculto(entrada):
+    if entrada.name.startswith(('.', '~$')) or entrada.name.lower() in CARPETAS_SISTEMA:
+        return True
+    if os.name != 'nt':
+        return False
+    # En Windows el stat de os.scandir viene incluido, sin llamada extra
+    atributos = entrada.stat(follow_symlinks=False).st_file_attributes
+    return bool(atributos & (stat.FILE_ATTRIBUTE_HIDDEN | stat.FILE_ATTRIBUTE_SYSTEM))
+
+def excluido(relativa, nombre, es_carpeta, patrones):
+    # Patrones estilo .gitignore: con '/' se comparan con la ruta relativa,
+    # sin '/' con el nombre; terminados en '/' solo se aplican a carpetas
+    for patron in patrones:
+        if patron.endswith('/'):
+            if not es_carpeta:
+                continue
+            patron = patron.rstrip('/')
+        objetivo = relativa if '/' in patron else nombre
+        if fnmatch.fnmatch(objetivo, patron.lstrip('/')):
+            return True
+    return False
+
+def buscar_archivos_en_carpeta(carpeta, extensiones=None, tamano_max=0, excluir=(), ocultos=False):
+    # Generador: entrega cada archivo en cuanto se encuentra para que la
+    # extracción empiece antes de terminar el recorrido. Con extensiones=None
+    # no se filtra por tipo.
+    pendientes = [carpeta]
+    while pendientes:
+        actual = pendientes.pop()
+        try:
+            entradas = list(os.scandir(actual))
+        except OSError:
+            continue
+        for entrada in entradas:
+            try:
+                if not ocultos and es_oculto(entrada):
+                    continue
+                relativa = os.path.relpath(entrada.path, carpeta).replace(os.sep, '/')
+                if entrada.is_dir(follow_symlinks=False):
+                    if not excluido(relativa, entrada.name, True, excluir):
+                        pendientes.append(entrada.path)
+                    continue
+                if not entrada.is_file():
+                    continue
+                if extensiones is not None and entrada.name.lower().rsplit('.', 1)[-1] not in extensiones:
+                    continue
+                if excluido(relativa, entrada.name, False, excluir):
+                    continue
+                if tamano_max and entrada.stat().st_size > tamano_max:
+                    continue
+            except OSError:
+                continue
+            yield entrada.path
+
+def coincidencias_nombre(arch, palabras):
+    datos_doc = {'archivo': arch, 'matches': []}
+    ruta = normalizar(arch)
+    for p in palabras:
+        if normalizar(p) in ruta:
+            datos_doc['matches'].append({
+                'tipo': 'nombre/ruta',
+                'palabra': p,
+                'fragmento': os.path.basename(arch)
+            })
+    return datos_doc
+
+def resultado_contenido(cache, arch, snippet, buscador, max_fragmentos, max_coincidencias):
+    # Coincidencias en el contenido de un documento devuelto por el índice
+    datos_doc = {'archivo': arch, 'matches': [], 'copias': []}
+    es_imagen = arch.lower().split('.')[-1] in ('png', 'jpg', 'jpeg')
+    if es_imagen:
+        # El OCR completo se valora y se devuelve entero
+        contenido, ubicaciones = leer_documento(cache, arch)
+        confiable = is_ocr_reliable(contenido)
+        segmentos = dividir_segmentos(contenido, ubicaciones)
+    else:
+        # Página a página / hoja a hoja desde la caché: con max_coincidencias
+        # no se leen las páginas que quedan tras alcanzarlo
+        contenido, confiable = '', True
+        segmentos = segmentos_documento(cache, arch)
+    # Todas las palabras en una sola pasada
+    resumen = resumir_coincidencias(buscador, segmentos, max_fragmentos, max_coincidencias)
+    if resumen:
+        coincidencias = [(p, r['ocurrencias'], r['fragmentos']) for p, r in resumen.items()]
+    else:
+        # Coincidencias que solo resuelve el índice (consulta avanzada, acentos...)
+        terminos = sorted(set(t.lower() for t in re.findall(f'{INICIO_RESALTE}(.*?){FIN_RESALTE}', snippet)))
+        coincidencias = [(', '.join(terminos), 1, [('', snippet)])]
+    for palabra, ocurrencias, fragmentos in coincidencias:
+        if es_imagen:
+            datos_doc['matches'].append({
+                'tipo': 'OCR Imagen' + ('' if confiable else ' (NO CONCLUYENTE)'),
+                'palabra': palabra,
+                'ocurrencias': ocurrencias,
+                'fragmento': fragmentos[0][1] if confiable else 'OCR demasiado corto o ruidoso',
+                'fragmentos': fragmentos if confiable else [],
+                'ocr': contenido if confiable else ''
+            })
+        else:
+            datos_doc['matches'].append({
+                'tipo': 'contenido',
+                'palabra': palabra,
+                'ocurrencias': ocurrencias,
+                'fragmento': fragmentos[0][1],
+                'fragmentos': fragmentos
+            })
+    return datos_doc
+
+def variantes_aproximadas(cache, palabras, distancia):
+    # {palabra: [términos del índice a distancia de edición <= distancia]}
+    variantes = {}
+    for p in palabras:
+        normalizada = normalizar(p)
+        if aproximable(normalizada, distancia):
+            variantes[p] = [t for t in terminos_parecidos(cache, normalizada, distancia)
+                            if t != normalizada and distancia_edicion(normalizada, t, distancia) <= distancia]
+    return variantes
+
+def indexar(carpeta, cache, workers=None, limite_segundos=120, limite_memoria_mb=2048,
+            reintentar_omitidos=False, tamano_max=0, excluir=(), ocultos=False, telemetria=None):
+    # Recorre la carpeta y pone al día el índice. Genera eventos 'archivo' por
+    # cada archivo extraído o leído de la caché, 'sin_extractor' por los de
+    # formato no soportado y, al terminar, 'indexado' con lo purgado.
+    # La caché guarda rutas absolutas, como vigilar: la misma carpeta escrita
+    # de otra forma (relativa, con '/' en Windows) usa las mismas entradas.
+    carpeta = os.path.abspath(carpeta)
+    vistos = []
+
+    def recorrido():
+        # Solo los formatos soportados pasan a extracción; del resto basta el nombre
+        for arch in buscar_archivos_en_carpeta(carpeta, None, tamano_max, excluir, ocultos):
+            if extension_soportada(arch):
+                vistos.append(arch)
+                yield arch
+            else:
+                eventos_sin_extractor.append(arch)
+
+    eventos_sin_extractor = []
+    extraidos = extraer_textos(recorrido(), cache, workers, limite_segundos, limite_memoria_mb,
+                               reintentar_omitidos, telemetria)
+    for i, (arch, _, _, estado) in enumerate(extraidos):
+        while eventos_sin_extractor:
+            yield {'evento': 'sin_extractor', 'archivo': eventos_sin_extractor.pop()}
+        # extraer_textos ya confirma cada archivo guardado
+        yield {'evento': 'archivo', 'archivo': arch, 'estado': estado, 'procesados': i + 1,
+               'encontrados': len(vistos)}
+    while eventos_sin_extractor:
+        yield {'evento': 'sin_extractor', 'archivo': eventos_sin_extractor.pop()}
+    cache.commit()
+    borrados = purgar_cache(cache, carpeta, set(vistos))
+    yield {'evento': 'indexado', 'carpeta': carpeta, 'procesados': len(vistos), 'borrados': borrados}
+
+def buscar(carpeta, palabras, consulta=None, todas=False, workers=None, limite_segundos=120,
+           limite_memoria_mb=2048, reintentar_omitidos=False, tamano_max=0, excluir=(), ocultos=False,
+           max_fragmentos=3, max_coincidencias=0, distancia=0, solo_indice=False, telemetria=None, cache=None):
+    # Generador de eventos (diccionarios con la clave 'evento'):
+    #   'archivo'   cada archivo procesado, con su estado y coincidencias por nombre
+    #   'error'     la consulta no es válida para el índice
+    #   'resultado' cada documento con coincidencias, por relevancia
+    #   'fin'       resumen de la búsqueda
+    # consulta permite pasar una consulta FTS5 propia en vez de las palabras.
+    # Con distancia > 0 también encuentra palabras con ese número de erratas.
+    # Con solo_indice no se recorre la carpeta: se consulta el índice tal como lo
+    # deja el indexador en segundo plano (vigilar), sin depender del tamaño.
+    # telemetria (telemetria.Telemetria) recoge las medidas de cada extracción.
+    carpeta = os.path.abspath(carpeta)
+    propia = cache is None
+    if propia:
+        cache = abrir_cache()
+    resultados = {}
+    procesados = 0
+
+    try:
+        # La caché conserva archivos que ahora quedan fuera de los filtros: solo
+        # cuentan los que admite esta búsqueda
+        if solo_indice:
+            rutas = [r for r in rutas_indexadas(cache, carpeta) if admitido_por_nombre(carpeta, r, excluir, ocultos)
+                     and (not tamano_max or admitido(carpeta, r, tamano_max, excluir, ocultos))]
+            vigentes = set(rutas)
+            procesados = len(rutas)
+            for arch in rutas:
+                datos_doc = coincidencias_nombre(arch, palabras)
+                if datos_doc['matches']:
+                    resultados[arch] = datos_doc
+        else:
+            vigentes = set()
+            for evento in indexar(carpeta, cache, workers, limite_segundos, limite_memoria_mb,
+                                  reintentar_omitidos, tamano_max, excluir, ocultos, telemetria):
+                if evento['evento'] == 'indexado':
+                    procesados = evento['procesados']
+                    continue
+                if evento['evento'] == 'archivo':
+                    vigentes.add(evento['archivo'])
+                datos_doc = coincidencias_nombre(evento['archivo'], palabras)
+                if datos_doc['matches']:
+                    resultados[evento['archivo']] = datos_doc
+                if evento['evento'] == 'archivo':
+                    yield {**evento, 'matches': datos_doc['matches']}
+
+        # El contenido se resuelve contra el índice invertido, ordenado por BM25
+        variantes = {}
+        if distancia and not consulta:
+            actualizar_terminos(cache)
+            variantes = variantes_aproximadas(cache, palabras, distancia)
+        try:
+            encontrados = buscar_indice(cache, consulta or consulta_fts(palabras, todas, variantes), carpeta)
+        except sqlite3.OperationalError as e:
+            yield {'evento': 'error', 'mensaje': f"Consulta no válida: {e}"}
+            encontrados = []
+
+        resultados_contenido = {}
+        por_huella = {}
+        buscador = BuscadorAproximado(palabras, distancia) if distancia else BuscadorPalabras(palabras)
+        for arch, _, snippet, huella in encontrados:
+            if arch not in vigentes:
+                continue
+            # Los archivos idénticos se agrupan bajo la primera aparición
+            if huella in por_huella:
+                grupo = resultados_contenido[por_huella[huella]]
+                grupo['copias'].append(arch)
+                grupo['matches'].extend(resultados.pop(arch, {'matches': []})['matches'])
+                continue
+            if huella:
+                por_huella[huella] = arch
+            datos_doc = resultado_contenido(cache, arch, snippet, buscador, max_fragmentos, max_coincidencias)
+            datos_doc['matches'].extend(resultados.pop(arch, {'matches': []})['matches'])
+            resultados_contenido[arch] = datos_doc
+
+        coincidencias_tot = 0
+        for datos_doc in list(resultados_contenido.values()) + list(resultados.values()):
+            coincidencias_tot += sum(m.get('ocurrencias', 0) for m in datos_doc['matches'])
+            yield {'evento': 'resultado', **datos_doc}
+        yield {'evento': 'fin', 'procesados': procesados,
+               'documentos': len(resultados_contenido) + len(resultados),
+               'por_contenido': len(resultados_contenido), 'coincidencias_tot': coincidencias_tot}
+    finally:
+        if propia:
+            cache.close()
+
+def admitido_por_nombre(carpeta, ruta, excluir=(), ocultos=False):
+    # Reglas del recorrido que solo dependen de la ruta (exclusiones y ocultos)
+    relativa = os.path.relpath(ruta, carpeta).replace(os.sep, '/')
+    if relativa.startswith('../') or relativa == '..':
+        return False
+    partes = relativa.split('/')
+    for n, nombre in enumerate(partes):
+        if not ocultos and (nombre.startswith(('.', '~$')) or nombre.lower() in CARPETAS_SISTEMA):
+            return False
+        if excluido('/'.join(partes[:n + 1]), nombre, n < len(partes) - 1, excluir):
+            return False
+    return True
+
+def admitido(carpeta, ruta, tamano_max=0, excluir=(), ocultos=False):
+    # Mismas reglas que el recorrido, para una ruta suelta notificada por el sistema
+    if not admitido_por_nombre(carpeta, ruta, excluir, ocultos):
+        return False
+    try:
+        info = os.stat(ruta)
+    except OSError:
+        return False
+    return stat.S_ISREG(info.st_mode) and not (tamano_max and info.st_size > tamano_max)
+
+def vigilar(carpetas, intervalo=60, workers=None, limite_segundos=120, limite_memoria_mb=2048,
+            tamano_max=0, excluir=(), ocultos=False, telemetria=None, cache=None):
+    # Indexador en segundo plano: una pasada completa por carpeta al arrancar y
+    # después incremental. Con watchdog (inotify en Linux) se procesan solo las
+    # rutas notificadas; sin él, se repite la pasada cada 'intervalo' segundos,
+    # que solo extrae lo que ha cambiado de tamaño o fecha. Genera los eventos
+    # de indexar ('archivo' lleva incremental=True fuera de las pasadas completas)
+    # más 'olvidados' con las entradas borradas. No termina nunca.
+    propia = cache is None
+    if propia:
+        cache = abrir_cache()
+    carpetas = [os.path.abspath(c) for c in carpetas]
+    cambios = set()
+    cerrojo = threading.Lock()
+    aviso = threading.Event()
+    observador = None
+    if Observer is not None:
+        class Manejador(FileSystemEventHandler):
+            def on_any_event(self, evento):
+                # Que cambie la fecha de una carpeta solo significa que cambió
+                # algo dentro, y eso ya llega como evento propio
+                if evento.event_type in ('opened', 'closed_no_write') or (
+                        evento.is_directory and evento.event_type == 'modified'):
+                    return
+                with cerrojo:
+                    cambios.add(os.fsdecode(evento.src_path))
+                    if getattr(evento, 'dest_path', ''):
+                        cambios.add(os.fsdecode(evento.dest_path))
+                aviso.set()
+
+        observador = Observer()
+        for carpeta in carpetas:
+            observador.schedule(Manejador(), carpeta, recursive=True)
+        observador.start()
+
+    def pasada_completa():
+        for carpeta in carpetas:
+            yield from indexar(carpeta, cache, workers, limite_segundos, limite_memoria_mb,
+                               False, tamano_max, excluir, ocultos, telemetria)
+
+    try:
+        yield from pasada_completa()
+        while True:
+            if observador is None:
+                time.sleep(intervalo)
+                yield from pasada_completa()
+                continue
+            aviso.wait()
+            # Se deja pasar un momento para agrupar las escrituras de un mismo guardado
+            time.sleep(1)
+            with cerrojo:
+                rutas = sorted(cambios)
+                cambios.clear()
+                aviso.clear()
+            archivos, desaparecidos = [], []
+            for ruta in rutas:
+                carpeta = next((c for c in carpetas if ruta == c or ruta.startswith(os.path.join(c, ''))), None)
+                if carpeta is None:
+                    continue
+                if os.path.isdir(ruta):
+                    # Carpeta nueva o movida: se recorre entera
+                    archivos.extend(a for a in buscar_archivos_en_carpeta(ruta, None, tamano_max, (), ocultos)
+                                    if extension_soportada(a) and admitido(carpeta, a, tamano_max, excluir, ocultos))
+                elif not os.path.exists(ruta):
+                    desaparecidos.append(ruta)
+                elif extension_soportada(ruta) and admitido(carpeta, ruta, tamano_max, excluir, ocultos):
+                    archivos.append(ruta)
+            if desaparecidos:
+                yield {'evento': 'olvidados', 'rutas': desaparecidos,
+                       'borrados': olvidar_rutas(cache, desaparecidos)}
+            archivos = list(dict.fromkeys(archivos))
+            extraidos = extraer_textos(archivos, cache, workers, limite_segundos, limite_memoria_mb,
+                                       telemetria=telemetria)
+            for i, (arch, _, _, estado) in enumerate(extraidos):
+                yield {'evento': 'archivo', 'archivo': arch, 'estado': estado, 'procesados': i + 1,
+                       'encontrados': len(archivos), 'incremental': True}
+    finally:
+        if observador is not None:
+            observador.stop()
+            observador.join()
+        if propia:
+            cache.close()
+
+def evento_json(evento):
+    # En JSON los fragmentos van sin marcadores de resalte: cada uno lleva
+    # aparte las posiciones [inicio, fin] de los términos encontrados
+    if evento['evento'] != 'resultado':
+        return evento
+    matches = []
+    for match in evento['matches']:
+        match = dict(match)
+        match['fragmento'], match['resaltes'] = quitar_resaltes(match['fragmento'])
+        if 'fragmentos' in match:
+            match['fragmentos'] = [[ubicacion, *quitar_resaltes(fragmento)]
+                                   for ubicacion, fragmento in match['fragmentos']]
+        matches.append(match)
+    return {**evento, 'matches': matches}
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Buscador de contenido en carpetas sin interfaz gráfica")
+    ordenes = parser.add_subparsers(dest='orden', required=True)
+    # Opciones comunes de recorrido y extracción
+    comunes = argparse.ArgumentParser(add_help=False)
+    comunes.add_argument('--workers', type=int, default=None)
+    comunes.add_argument('--json', action='store_true', help="Emitir cada evento como una línea JSON")
+    comunes.add_argument('--timeout', type=float, default=120, help="Segundos máximos por archivo (0 = sin límite)")
+    comunes.add_argument('--memoria', type=int, default=2048, help="MB máximos por archivo (0 = sin límite)")
+    comunes.add_argument('--tamano-max', type=int, default=0, help="Ignorar archivos mayores de N MB")
+    comunes.add_argument('--excluir', action='append', default=[], help="Patrón estilo .gitignore (repetible)")
+    comunes.add_argument('--ocultos', action='store_true', help="Incluir archivos y carpetas ocultos")
+    comunes.add_argument('--tesseract', help="Ruta del ejecutable de Tesseract (o variable TESSERACT_CMD)")
+    comunes.add_argument('--telemetria', metavar='RUTA',
+                         help="Guardar las medidas de extracción al terminar (.csv o .json)")
+
+    p_buscar = ordenes.add_parser('search', parents=[comunes], help="Buscar palabras en una carpeta")
+    p_buscar.add_argument('carpeta')
+    p_buscar.add_argument('palabras', help="Palabras separadas por coma, buscadas como inicio de palabra "
+                                           "(o consulta FTS5 con --consulta)")
+    p_buscar.add_argument('--todas', action='store_true', help="Exigir todas las palabras (AND)")
+    p_buscar.add_argument('--consulta', action='store_true', help="Interpretar PALABRAS como consulta FTS5")
+    p_buscar.add_argument('--distancia', type=int, default=0, help="Erratas toleradas por palabra (0 = exacta)")
+    p_buscar.add_argument('--solo-indice', action='store_true',
+                          help="No recorrer la carpeta: consultar el índice que mantiene 'watch'")
+    p_buscar.add_argument('--fragmentos', type=int, default=3)
+    p_buscar.add_argument('--max-coincidencias', type=int, default=0,
+                          help="Apariciones a contar por archivo (0 = todas); no acorta la extracción")
+
+    p_vigilar = ordenes.add_parser('watch', parents=[comunes], help="Mantener el índice al día en segundo plano")
+    p_vigilar.add_argument('carpetas', nargs='+')
+    p_vigilar.add_argument('--intervalo', type=float, default=60,
+                           help="Segundos entre pasadas si no hay watchdog (inotify)")
+    args = parser.parse_args(argumentos)
+
+    for carpeta in getattr(args, 'carpetas', None) or [args.carpeta]:
+        if not os.path.isdir(carpeta):
+            parser.error(f"Ruta no válida o no es carpeta: {carpeta}")
+    if args.tesseract:
+        # Los procesos de extracción heredan el entorno
+        os.environ['TESSERACT_CMD'] = args.tesseract
+    telemetria = Telemetria() if args.telemetria else None
+    if args.orden == 'watch':
+        eventos = vigilar(args.carpetas, args.intervalo, workers=args.workers, limite_segundos=args.timeout,
+                          limite_memoria_mb=args.memoria, tamano_max=args.tamano_max * 1024 * 1024,
+                          excluir=args.excluir, ocultos=args.ocultos, telemetria=telemetria)
+    else:
+        palabras = [p.strip() for p in args.palabras.split(",") if p.strip()]
+        eventos = buscar(args.carpeta, palabras, consulta=args.palabras if args.consulta else None,
+                         todas=args.todas, workers=args.workers, limite_segundos=args.timeout,
+                         limite_memoria_mb=args.memoria, tamano_max=args.tamano_max * 1024 * 1024,
+                         excluir=args.excluir, ocultos=args.ocultos, max_fragmentos=args.fragmentos,
+                         max_coincidencias=args.max_coincidencias, distancia=args.distancia,
+                         solo_indice=args.solo_indice, telemetria=telemetria)
+    try:
+        for evento in eventos:
+            if args.json:
+                print(json.dumps(evento_json(evento), ensure_ascii=False), flush=True)
+            elif evento['evento'] == 'resultado':
+                palabras_doc = sorted(set(m['palabra'] for m in evento['matches']))
+                print(f"{evento['archivo']}: {', '.join(palabras_doc)}")
+                for copia in evento.get('copias', []):
+                    print(f"  = {copia}")
+            elif evento['evento'] == 'archivo' and evento['estado'] != ESTADO_OK:
+                print(f"{evento['archivo']}: {evento['estado']}", file=sys.stderr)
+            elif evento['evento'] == 'archivo' and evento.get('incremental'):
+                print(f"{time.strftime('%H:%M:%S')} indexado {evento['archivo']}", file=sys.stderr, flush=True)
+            elif evento['evento'] == 'indexado':
+                print(f"{time.strftime('%H:%M:%S')} {evento['carpeta']}: {evento['procesados']} archivos al día, "
+                      f"{evento['borrados']} entradas purgadas", file=sys.stderr, flush=True)
+            elif evento['evento'] == 'olvidados':
+                for ruta in evento['rutas']:
+                    print(f"{time.strftime('%H:%M:%S')} eliminado {ruta}", file=sys.stderr, flush=True)
+            elif evento['evento'] == 'error':
+                print(evento['mensaje'], file=sys.stderr)
+            elif evento['evento'] == 'fin':
+                print(f"{evento['documentos']} documentos con coincidencias de {evento['procesados']} analizados",
+                      file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if telemetria is not None:
+            telemetria.guardar(args.telemetria)
+
+if __name__ == '__main__':
+    main()
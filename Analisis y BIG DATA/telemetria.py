@@ -0,0 +1,83 @@
+import io
+import csv
+import json
+
+# Medidas de la extracción, una por archivo: tiempo, bytes, caracteres y tipo
+# de error. Sirven para ajustar el número de procesos y decidir qué excluir.
+CAMPOS = ('archivo', 'formato', 'origen', 'estado', 'error', 'segundos', 'bytes', 'caracteres')
+
+# Origen de cada medida
+ORIGEN_EXTRAIDO = 'extraído'
+ORIGEN_CACHE = 'caché'
+ORIGEN_COPIA = 'copia'
+
+
+class Telemetria:
+
+    def __init__(self):
+        self.medidas = []
+
+    def registrar(self, archivo, origen, estado, error=None, segundos=0.0, tamano=0, caracteres=0):
+        self.medidas.append({
+            'archivo': archivo,
+            'formato': archivo.lower().rsplit('.', 1)[-1],
+            'origen': origen,
+            'estado': estado,
+            'error': error or '',
+            'segundos': round(segundos, 4),
+            'bytes': tamano,
+            'caracteres': caracteres,
+        })
+
+    def por_formato(self):
+        # Rendimiento de lo realmente extraído; la caché solo cuenta como aciertos
+        formatos = {}
+        for m in self.medidas:
+            f = formatos.setdefault(m['formato'], {'formato': m['formato'], 'archivos': 0, 'extraidos': 0,
+                                                   'de_cache': 0, 'fallos': 0, 'segundos': 0.0, 'mb': 0.0,
+                                                   'caracteres': 0})
+            f['archivos'] += 1
+            if m['origen'] != ORIGEN_EXTRAIDO:
+                f['de_cache'] += 1
+                continue
+            f['extraidos'] += 1
+            f['fallos'] += bool(m['error'])
+            f['segundos'] += m['segundos']
+            f['mb'] += m['bytes'] / (1024 * 1024)
+            f['caracteres'] += m['caracteres']
+        for f in formatos.values():
+            f['archivos_s'] = round(f['extraidos'] / f['segundos'], 2) if f['segundos'] else None
+            f['mb_s'] = round(f['mb'] / f['segundos'], 3) if f['segundos'] else None
+            f['segundos'] = round(f['segundos'], 3)
+            f['mb'] = round(f['mb'], 3)
+        return sorted(formatos.values(), key=lambda f: f['segundos'], reverse=True)
+
+    def mas_lentos(self, n=10):
+        extraidos = [m for m in self.medidas if m['origen'] == ORIGEN_EXTRAIDO]
+        return sorted(extraidos, key=lambda m: m['segundos'], reverse=True)[:n]
+
+    def fallos(self):
+        # Número de archivos por formato y tipo de error
+        cuenta = {}
+        for m in self.medidas:
+            if m['error']:
+                clave = (m['formato'], m['error'])
+                cuenta[clave] = cuenta.get(clave, 0) + 1
+        return [{'formato': f, 'error': e, 'archivos': n}
+                for (f, e), n in sorted(cuenta.items(), key=lambda c: c[1], reverse=True)]
+
+    def a_csv(self):
+        salida = io.StringIO()
+        escritor = csv.DictWriter(salida, fieldnames=CAMPOS)
+        escritor.writeheader()
+        escritor.writerows(self.medidas)
+        return salida.getvalue()
+
+    def a_json(self):
+        return json.dumps({'por_formato': self.por_formato(), 'fallos': self.fallos(),
+                           'medidas': self.medidas}, ensure_ascii=False, indent=1)
+
+    def guardar(self, ruta):
+        # CSV o JSON según la extensión
+        with open(ruta, 'w', encoding='utf8', newline='') as f:
+            f.write(self.a_json() if ruta.lower().endswith('.json') else self.a_csv())
@@ -0,0 +1,69 @@
+import os
+
+from cache_textos import abrir_cache, guardar_cache, buscar_indice, leer_cache
+from extractores import extraer_textos, VERSION_EXTRACTOR
+
+
+def buscar(cache, consulta, carpeta):
+    return [fila[0] for fila in buscar_indice(cache, consulta, carpeta)]
+
+
+def test_guardar_de_nuevo_actualiza_el_indice(tmp_path):
+    cache = abrir_cache(str(tmp_path / 'cache.db'))
+    ruta = str(tmp_path / 'a.txt')
+    guardar_cache(cache, ruta, 5, 1, VERSION_EXTRACTOR, 'hola factura')
+    cache.commit()
+    guardar_cache(cache, ruta, 9, 2, VERSION_EXTRACTOR, 'hola albaran')
+    cache.commit()
+    assert buscar(cache, 'albaran', str(tmp_path)) == [ruta]
+    assert buscar(cache, 'factura', str(tmp_path)) == []
+
+
+def test_archivo_modificado_se_vuelve_a_extraer(tmp_path):
+    cache = abrir_cache(str(tmp_path / 'cache.db'))
+    ruta = tmp_path / 'a.txt'
+    ruta.write_text('hola factura\n', encoding='utf-8')
+    assert [doc[0] for doc in extraer_textos([str(ruta)], cache, workers=1)] == [str(ruta)]
+    with open(ruta, 'a', encoding='utf-8') as f:
+        f.write('otra linea con albaran\n')
+    os.utime(ruta, ns=(os.stat(ruta).st_atime_ns, os.stat(ruta).st_mtime_ns + 1_000_000))
+    texto = list(extraer_textos([str(ruta)], cache, workers=1))[0][1]
+    assert 'albaran' in texto
+    info = os.stat(ruta)
+    assert leer_cache(cache, str(ruta), info.st_size, info.st_mtime_ns, VERSION_EXTRACTOR)[0] == texto
+    assert buscar(cache, 'albaran', str(tmp_path)) == [str(ruta)]
+
+
+def test_buscar_indice_devuelve_todos_los_documentos(tmp_path):
+    cache = abrir_cache(str(tmp_path / 'cache.db'))
+    for n in range(1500):
+        guardar_cache(cache, str(tmp_path / f'{n}.txt'), 1, 1, VERSION_EXTRACTOR, f'factura {n}')
+    cache.commit()
+    assert len(buscar(cache, 'factura', str(tmp_path))) == 1500
+
+
+def test_la_misma_carpeta_escrita_de_otra_forma_comparte_entradas(tmp_path, monkeypatch):
+    from motor_busqueda import buscar as buscar_carpeta
+    carpeta = tmp_path / 'docs'
+    carpeta.mkdir()
+    (carpeta / 'a.txt').write_text('hola factura\n', encoding='utf-8')
+    cache = abrir_cache(str(tmp_path / 'cache.db'))
+    monkeypatch.chdir(tmp_path)
+    list(buscar_carpeta(str(carpeta), ['factura'], workers=1, cache=cache))
+    eventos = list(buscar_carpeta('docs/', ['factura'], solo_indice=True, cache=cache))
+    assert eventos[-1]['por_contenido'] == 1
+    assert cache.execute('SELECT COUNT(*) FROM textos').fetchone()[0] == 1
+
+
+def test_segmentos_documento_coincide_con_el_texto_completo(tmp_path):
+    from cache_textos import leer_documento, segmentos_documento
+    from coincidencias import dividir_segmentos
+    cache = abrir_cache(str(tmp_path / 'cache.db'))
+    ruta = str(tmp_path / 'a.pdf')
+    texto = 'página uno ñandú\nsegunda línea\ndos: acción €\ntres'
+    ubicaciones = [[0, 'pág. 1', 'línea'], [31, 'pág. 2', 'línea'], [45, 'pág. 3', 'línea']]
+    guardar_cache(cache, ruta, 1, 1, VERSION_EXTRACTOR, texto, ubicaciones)
+    assert list(segmentos_documento(cache, ruta)) == list(dividir_segmentos(*leer_documento(cache, ruta)))
+    guardar_cache(cache, ruta, 1, 1, VERSION_EXTRACTOR, texto)
+    assert list(segmentos_documento(cache, ruta)) == [('', 'línea', texto)]
+    assert list(segmentos_documento(cache, str(tmp_path / 'otro.pdf'))) == []
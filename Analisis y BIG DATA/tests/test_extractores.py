@@ -0,0 +1,64 @@
+import zlib
+
+from extractores import extraer_con_error, extraer_documento
+
+
+def pdf_texto_e_imagen(ruta):
+    # PDF mínimo: una página con capa de texto y otra solo con una imagen
+    imagen = zlib.compress(bytes(255 * ((x // 8 + y // 8) % 2) for y in range(64) for x in range(64)))
+    texto = b'BT /F1 14 Tf 50 700 Td (Primera pagina con la palabra factura y texto normal) Tj ET'
+    dibujo = b'q 200 0 0 200 100 400 cm /Im1 Do Q'
+    objetos = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R 4 0 R] /Count 2 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 5 0 R >> >> '
+        b'/Contents 6 0 R >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /XObject << /Im1 7 0 R >> >> '
+        b'/Contents 8 0 R >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+        b'<< /Length %d >>\nstream\n%s\nendstream' % (len(texto), texto),
+        b'<< /Type /XObject /Subtype /Image /Width 64 /Height 64 /ColorSpace /DeviceGray /BitsPerComponent 8 '
+        b'/Filter /FlateDecode /Length %d >>\nstream\n%s\nendstream' % (len(imagen), imagen),
+        b'<< /Length %d >>\nstream\n%s\nendstream' % (len(dibujo), dibujo),
+    ]
+    salida = bytearray(b'%PDF-1.4\n')
+    posiciones = []
+    for n, objeto in enumerate(objetos, 1):
+        posiciones.append(len(salida))
+        salida += b'%d 0 obj\n%s\nendobj\n' % (n, objeto)
+    xref = len(salida)
+    salida += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objetos) + 1)
+    salida += b''.join(b'%010d 00000 n \n' % p for p in posiciones)
+    salida += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objetos) + 1, xref)
+    ruta.write_bytes(bytes(salida))
+
+
+def test_pdf_sin_tesseract_conserva_las_paginas_con_texto(tmp_path, monkeypatch):
+    monkeypatch.setenv('TESSERACT_CMD', str(tmp_path / 'no_existe' / 'tesseract'))
+    ruta = tmp_path / 'dos.pdf'
+    pdf_texto_e_imagen(ruta)
+    texto, ubicaciones, error = extraer_con_error(str(ruta))
+    assert error is None
+    assert 'factura' in texto
+    assert [u[1] for u in ubicaciones] == ['pág. 1', 'pág. 2 (sin OCR)']
+
+
+def test_sin_tesseract_extraer_documento_devuelve_vacio(tmp_path, monkeypatch):
+    from PIL import Image
+    monkeypatch.setenv('TESSERACT_CMD', str(tmp_path / 'no_existe' / 'tesseract'))
+    ruta = tmp_path / 'imagen.png'
+    Image.new('L', (40, 40), 255).save(ruta)
+    assert extraer_documento(str(ruta)) == ('', [])
+
+
+def test_mismo_contenido_con_otra_extension_se_extrae_aparte(tmp_path):
+    from cache_textos import abrir_cache
+    from extractores import extraer_textos
+    contenido = '<html><body><p>hola factura</p></body></html>\n'
+    (tmp_path / 'a.html').write_text(contenido, encoding='utf-8')
+    (tmp_path / 'a.txt').write_text(contenido, encoding='utf-8')
+    cache = abrir_cache(str(tmp_path / 'cache.db'))
+    textos = {ruta: texto for ruta, texto, _, _ in
+              extraer_textos([str(tmp_path / 'a.html'), str(tmp_path / 'a.txt')], cache, workers=2)}
+    assert '<p>' not in textos[str(tmp_path / 'a.html')]
+    assert '<p>' in textos[str(tmp_path / 'a.txt')]
@@ -0,0 +1,24 @@
+import pandas as pd
+
+from ingesta_datos import convertir_texto, leer_tabla, unir_tablas
+
+
+def test_fecha_vacia_sigue_vacia():
+    df = leer_tabla(b'cp,nombre,fecha\n1,a,2024-01-05\n2,b,\n3,c,2024-02-01\n', 'datos.csv')
+    assert df['fecha'].isna().tolist() == [False, True, False]
+    assert df['fecha'].iloc[2] == pd.Timestamp('2024-02-01')
+
+
+def test_codigos_con_ceros_siguen_siendo_texto():
+    assert convertir_texto(pd.Series(['01001', '28001', '007'])).tolist() == ['01001', '28001', '007']
+    assert convertir_texto(pd.Series(['10', '-3', '2.5'])).tolist() == [10, -3, 2.5]
+
+
+def test_referencias_no_son_fechas():
+    assert convertir_texto(pd.Series(['1-2', '3-4', '1-2'])).astype(str).tolist() == ['1-2', '3-4', '1-2']
+
+
+def test_union_conserva_fechas_vacias():
+    df = unir_tablas({'a': pd.DataFrame({'fecha': pd.to_datetime(['2024-01-01', None])}),
+                      'b': pd.DataFrame({'fecha': ['2024-02-01', None]})})
+    assert df['fecha'].isna().tolist() == [False, True, False, True]
@@ -3,62 +3,126 @@ import sqlite3
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
 import datetime
+from contextlib import contextmanager
 from openpyxl import Workbook
 
 DB_FILE = "notas_movil.db"
 
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS notes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT,
-            content TEXT,
-            state TEXT,
-            tags TEXT,
-            archived INTEGER DEFAULT 0,
-            created_at TEXT,
-            updated_at TEXT
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS states (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS tags (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL
-        )
-    ''')
-    conn.commit()
-
-    # Insertar estados por defecto si no existen
-    default_states = ["Por hacer", "En Progreso", "Completado", "Pendiente"]
-    for st in default_states:
+# Modo de diario de SQLite. WAL permite leer mientras se escribe y hace baratos
+# los commits; si la base está en una carpeta de red compartida por varios
+# equipos, usar NOTAS_DB_JOURNAL=DELETE.
+JOURNAL_MODE = os.environ.get("NOTAS_DB_JOURNAL", "WAL")
+PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",  # 16 MB
+    "PRAGMA busy_timeout=5000",
+)
+
+# Migraciones del esquema: la posición + 1 es la versión que dejan guardada en
+# PRAGMA user_version. Solo se añaden al final, nunca se modifican.
+MIGRATIONS = [
+    # 1: esquema inicial (las bases antiguas ya lo tienen, de ahí IF NOT EXISTS)
+    '''
+    CREATE TABLE IF NOT EXISTS notes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT,
+        content TEXT,
+        state TEXT,
+        tags TEXT,
+        archived INTEGER DEFAULT 0,
+        created_at TEXT,
+        updated_at TEXT
+    );
+    CREATE TABLE IF NOT EXISTS states (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS tags (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL
+    );
+    ''',
+    # 2: listado de notas activas/archivadas sin recorrer toda la tabla
+    '''
+    CREATE INDEX IF NOT EXISTS idx_notes_archived ON notes(archived);
+    ''',
+]
+
+DEFAULT_STATES = ["Por hacer", "En Progreso", "Completado", "Pendiente"]
+
+
+class Database:
+    # Una sola conexión para toda la aplicación, con las sentencias preparadas
+    # en caché. Fuera de transaction() cada sentencia se confirma sola.
+
+    def __init__(self, path=DB_FILE):
+        self.conn = sqlite3.connect(path, isolation_level=None, cached_statements=256)
+        self.conn.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+        for pragma in PRAGMAS:
+            self.conn.execute(pragma)
+        self.depth = 0
+
+    @contextmanager
+    def transaction(self):
+        # Las escrituras dentro del bloque se confirman juntas; anidado, forma
+        # parte de la transacción exterior
+        if self.depth:
+            self.depth += 1
+            try:
+                yield self
+            finally:
+                self.depth -= 1
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.depth = 1
         try:
-            c.execute('INSERT INTO states(name) VALUES(?)', (st,))
-        except sqlite3.IntegrityError:
-            pass
-    conn.commit()
-    conn.close()
-
-def fetchall(query, params=()): 
-    with sqlite3.connect(DB_FILE) as conn:
-        return list(conn.execute(query, params))
-
-def execute(query, params=()): 
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.execute(query, params)
-        conn.commit()
-        return cursor.lastrowid
+            yield self
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        else:
+            self.conn.execute("COMMIT")
+        finally:
+            self.depth = 0
+
+    def migrate(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            # executescript no admite parámetros ni transacciones abiertas: el
+            # script lleva su propio BEGIN/COMMIT junto con la nueva versión
+            try:
+                self.conn.executescript(f"BEGIN IMMEDIATE;\n{script}\nPRAGMA user_version={number};\nCOMMIT;")
+            except sqlite3.Error:
+                if self.conn.in_transaction:
+                    self.conn.execute("ROLLBACK")
+                raise
+
+    def fetchall(self, query, params=()):
+        return self.conn.execute(query, params).fetchall()
+
+    def execute(self, query, params=()):
+        return self.conn.execute(query, params).lastrowid
+
+    def executemany(self, query, rows):
+        with self.transaction():
+            self.conn.executemany(query, rows)
+
+    def close(self):
+        self.conn.close()
+
+
+def init_db(path=DB_FILE):
+    db = Database(path)
+    db.migrate()
+    # Insertar estados por defecto si no existen, en una sola transacción
+    db.executemany("INSERT OR IGNORE INTO states(name) VALUES(?)", [(st,) for st in DEFAULT_STATES])
+    return db
 
 class App:
-    def __init__(self, root):
+    def __init__(self, root, db):
         self.root = root
+        self.db = db
         self.root.title("Gestor de notas")
         self.root.geometry("1100x600")
 
@@ -120,7 +184,7 @@ class App:
         ttk.Button(inferior, text="Insertar cursiva", command=lambda: self.insert_markdown("_", "_")).pack(side=tk.LEFT)
 
     def load_states(self):
-        states = fetchall("SELECT name FROM states ORDER BY name")
+        states = self.db.fetchall("SELECT name FROM states ORDER BY name")
         menu = self.state_menu["menu"]
         menu.delete(0, "end")
         for state in states:
@@ -129,12 +193,12 @@ class App:
             self.state_var.set(states[0][0])
 
     def load_tags(self):
-        self.all_tags = [tag[0] for tag in fetchall("SELECT name FROM tags ORDER BY name")]
+        self.all_tags = [tag[0] for tag in self.db.fetchall("SELECT name FROM tags ORDER BY name")]
 
     def load_notes(self):
         self.tree.delete(*self.tree.get_children())
         archived_filter = 1 if self.show_archived else 0
-        notes = fetchall('SELECT id, title, state FROM notes WHERE archived=?', (archived_filter,))
+        notes = self.db.fetchall('SELECT id, title, state FROM notes WHERE archived=?', (archived_filter,))
         for note in notes:
             note_id, title, state = note
             self.tree.insert('', 'end', iid=note_id, values=(title, state))
@@ -151,7 +215,7 @@ class App:
         item_id = self.tree.focus()
         if not item_id:
             return
-        note = fetchall('SELECT * FROM notes WHERE id=?', (item_id,))
+        note = self.db.fetchall('SELECT * FROM notes WHERE id=?', (item_id,))
         if note:
             self.selected_note = item_id
             _, title, content, state, tags, archived, created_at, updated_at = note[0]
@@ -178,17 +242,17 @@ class App:
         tags = self.tags_var.get()
         now = datetime.datetime.now().isoformat()
         if self.selected_note:
-            execute('''UPDATE notes SET title=?, content=?, state=?, tags=?, updated_at=? WHERE id=?''',
-                    (title, content, state, tags, now, self.selected_note))
+            self.db.execute('''UPDATE notes SET title=?, content=?, state=?, tags=?, updated_at=? WHERE id=?''',
+                            (title, content, state, tags, now, self.selected_note))
         else:
-            execute('''INSERT INTO notes (title, content, state, tags, archived, created_at, updated_at)
-                    VALUES (?, ?, ?, ?, 0, ?, ?)''',
-                    (title, content, state, tags, now, now))
+            self.db.execute('''INSERT INTO notes (title, content, state, tags, archived, created_at, updated_at)
+                            VALUES (?, ?, ?, ?, 0, ?, ?)''',
+                            (title, content, state, tags, now, now))
         self.load_notes()
 
     def delete_note(self):
         if self.selected_note:
-            execute('DELETE FROM notes WHERE id=?', (self.selected_note,))
+            self.db.execute('DELETE FROM notes WHERE id=?', (self.selected_note,))
             self.load_notes()
         else:
             messagebox.showinfo("Eliminar", "Selecciona una nota para eliminar.")
@@ -197,7 +261,7 @@ class App:
         if not self.selected_note:
             messagebox.showinfo("Archivar", "Selecciona una nota para archivar.")
             return
-        execute('UPDATE notes SET archived=1 WHERE id=?', (self.selected_note,))
+        self.db.execute('UPDATE notes SET archived=1 WHERE id=?', (self.selected_note,))
         self.load_notes()
         self.clear_selected()
 
@@ -218,7 +282,7 @@ class App:
             WHERE archived=? AND 
             (title LIKE ? OR content LIKE ? OR tags LIKE ? OR state LIKE ?)'''
         param = f'%{term}%'
-        results = fetchall(query, (archived_filter, param, param, param, param))
+        results = self.db.fetchall(query, (archived_filter, param, param, param, param))
         for r in results:
             self.tree.insert('', 'end', iid=r[0], values=(r[1], r[2]))
 
@@ -258,7 +322,7 @@ class App:
         wb = Workbook()
         ws = wb.active
         ws.append(["ID", "Título", "Contenidos", "Estado", "Etiquetas", "Archivado", "Creado", "Actualizado"])
-        all_notes = fetchall('SELECT * FROM notes')
+        all_notes = self.db.fetchall('SELECT * FROM notes')
         for n in all_notes:
             ws.append(n)
         filename = filedialog.asksaveasfilename(defaultextension=".xlsx")
@@ -272,7 +336,7 @@ class App:
         win.geometry("300x400")
         listbox = tk.Listbox(win)
         listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-        estados = fetchall("SELECT name FROM states ORDER BY name")
+        estados = self.db.fetchall("SELECT name FROM states ORDER BY name")
         for e in estados:
             listbox.insert(tk.END, e[0])
         frame = tk.Frame(win)
@@ -285,7 +349,7 @@ class App:
             if not nombre:
                 return
             try:
-                execute("INSERT INTO states(name) VALUES(?)", (nombre,))
+                self.db.execute("INSERT INTO states(name) VALUES(?)", (nombre,))
                 listbox.insert(tk.END, nombre)
                 new_state_var.set("")
                 self.load_states()
@@ -299,13 +363,16 @@ class App:
                 return
             estado = listbox.get(sel[0])
             if messagebox.askyesno("Confirmar", f"Eliminar estado '{estado}'?"):
-                execute("DELETE FROM states WHERE name=?", (estado,))
+                self.db.execute("DELETE FROM states WHERE name=?", (estado,))
                 listbox.delete(sel[0])
                 self.load_states()
         tk.Button(win, text="Eliminar Estado Seleccionado", command=delete_state).pack(pady=5)
 
 if __name__ == "__main__":
-    init_db()
+    db = init_db()
     root = tk.Tk()
-    app = App(root)
-    root.mainloop()
+    app = App(root, db)
+    try:
+        root.mainloop()
+    finally:
+        db.close()